@@ -1,9 +1,10 @@
-"""ADK agent that answers questions over a user's Vertex AI RAG corpus.
+"""ADK agent that answers questions over a user's Vertex AI RAG corpora.
 
 The agent exposes two function tools:
 
-  - ``retrieve_documents`` : queries the user's RAG Engine corpus (the primary
-    source of truth, and where citations come from).
+  - ``retrieve_documents`` : queries the user's RAG Engine corpus and any
+    shared corpora they were granted, in parallel (the primary source of
+    truth, and where citations come from).
   - ``web_search``         : a Google Search grounded fallback for when the
     corpus has no relevant answer.
 
@@ -11,64 +12,111 @@ We deliberately use plain ``FunctionTool``s rather than ADK's built-in
 ``google_search`` / ``VertexAiRagRetrieval`` tools: ADK forbids mixing a
 built-in tool with other tools in a single agent, and function tools let us
 return structured citation data (filenames for corpus hits, URLs for web hits).
+
+Both tools are coroutines so a slow Vertex call never blocks the event loop
+(and every other user's stream) while ``runner.run_async`` awaits it. ADK runs
+the function calls of one model turn concurrently, so a turn that asks for
+both tools waits for the slower of the two rather than their sum.
 """
 
+import asyncio
+import logging
+import time
 from functools import partial
 
-from vertexai import rag
 from google.adk.agents import LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
 from google.adk.tools import FunctionTool
 from google.genai.types import GenerateContentConfig, GoogleSearch, Tool
 
-from app.config import MODEL_ID, client
+from app.config import MODEL_ID, get_client
+from app.core import capture, metrics, routing
+from app.settings import settings
+from app.services import retrieval
+
+logger = logging.getLogger(__name__)
+
+# Fast-tier model (see app.core.routing). Like MODEL_ID, a module attribute
+# so benchmarks can swap in a stand-in; model_for resolves both tiers.
+FAST_MODEL_ID = settings.fast_model_id
 
-# Retrieval tuning (mirrors the legacy retrieve_context_service settings).
-TOP_K = 10
-VECTOR_DISTANCE_THRESHOLD = 0.5
 
-# Built agents cached per corpus so we don't rebuild on every request.
-_agent_cache: dict[str, LlmAgent] = {}
+def model_for(tier: str):
+    """The model for routing ``tier`` (the default model if no fast one is set)."""
+    return (FAST_MODEL_ID if tier == routing.FAST else None) or MODEL_ID
 
 
-def _retrieve_documents(corpus_name: str, query: str) -> dict:
-    """Search the user's document corpus for passages relevant to ``query``.
+async def _retrieve_documents(corpora: tuple[str, ...], query: str) -> dict:
+    """Search the user's document corpora for passages relevant to ``query``.
 
-    Bound to a specific corpus via functools.partial in build_agent.
+    Bound to the user's corpora via functools.partial in build_agent.
     """
-    response = rag.retrieval_query(
-        rag_resources=[rag.RagResource(rag_corpus=corpus_name)],
-        rag_retrieval_config=rag.RagRetrievalConfig(
-            top_k=TOP_K,
-            filter=rag.Filter(vector_distance_threshold=VECTOR_DISTANCE_THRESHOLD),
-        ),
-        text=query,
-    )
+    return tool_result(await search_corpora(corpora, query))
 
-    contexts = []
-    for ctx in response.contexts.contexts:
-        contexts.append(
-            {
-                "text": ctx.text,
-                # Different RAG Engine versions expose the file name under
-                # different attributes; fall back gracefully.
-                "source": getattr(ctx, "source_display_name", None)
-                or getattr(ctx, "source_uri", None)
-                or "document",
-            }
-        )
-    return {"contexts": contexts}
 
+def tool_result(contexts: list[dict] | None) -> dict:
+    """The tool payload the model sees (``None``: the search failed)."""
+    if contexts is None:
+        return {"contexts": [], "error": "Document search is unavailable right now."}
+    return {"contexts": [{"text": c["text"], "source": c["source"]} for c in contexts]}
 
-def web_search(query: str) -> dict:
+
+async def search_corpora(corpora: tuple[str, ...], query: str) -> list[dict] | None:
+    """Scored ``{text, source, score}`` contexts, or ``None`` if search failed."""
+    trace = capture.current()
+    start = time.perf_counter()
+    try:
+        with metrics.stage("tool", "retrieve_documents").time():
+            contexts = await asyncio.wait_for(
+                retrieval.retrieve(corpora, query), timeout=settings.tool_timeout_seconds
+            )
+    except asyncio.TimeoutError:
+        logger.warning("retrieve_documents timed out after %ss", settings.tool_timeout_seconds)
+        if trace is not None:
+            trace.stage("retrieve", time.perf_counter() - start)
+            trace.note(retrieve_timeout=True)
+        return None
+    except retrieval.RetrievalUnavailable as exc:
+        # Vertex failing and nothing cached for this query (see retrieval).
+        logger.warning("retrieve_documents unavailable: %s", exc)
+        if trace is not None:
+            trace.stage("retrieve", time.perf_counter() - start)
+            trace.note(retrieve_error=str(exc))
+        return None
+    if trace is not None:
+        trace.stage("retrieve", time.perf_counter() - start)
+        trace.retrieval(contexts)
+    return contexts
+
+
+async def web_search(query: str) -> dict:
     """Search the public web (Google Search grounding) for ``query``.
 
     Use only when the document corpus has no relevant answer.
     """
-    response = client.models.generate_content(
-        model=MODEL_ID,
-        contents=query,
-        config=GenerateContentConfig(tools=[Tool(google_search=GoogleSearch())]),
-    )
+    client = get_client()
+    if client is None:
+        return {"summary": "", "sources": [], "error": "Web search is unavailable."}
+    trace = capture.current()
+    start = time.perf_counter()
+    try:
+        with metrics.stage("tool", "web_search").time():
+            response = await asyncio.wait_for(
+                client.aio.models.generate_content(
+                    model=MODEL_ID,
+                    contents=query,
+                    config=GenerateContentConfig(tools=[Tool(google_search=GoogleSearch())]),
+                ),
+                timeout=settings.tool_timeout_seconds,
+            )
+    except asyncio.TimeoutError:
+        logger.warning("web_search timed out after %ss", settings.tool_timeout_seconds)
+        if trace is not None:
+            trace.stage("web_search", time.perf_counter() - start)
+        return {"summary": "", "sources": [], "error": "Web search timed out."}
+    if trace is not None:
+        trace.stage("web_search", time.perf_counter() - start)
 
     sources = []
     try:
@@ -91,27 +139,71 @@ INSTRUCTION = (
     "the answer came from their documents or the web."
 )
 
+# Fast mode: the runner has already retrieved passages for the question, so
+# the model answers in one round trip.
+PREFETCHED_INSTRUCTION = (
+    "You are RAG Assistant, answering questions about the user's uploaded "
+    "documents. Passages already retrieved from the user's documents for the "
+    "current question are given below as document context; base your answer "
+    "on them. Only if they contain no relevant information should you call "
+    "`web_search`. Be concise and always tell the user whether the answer came "
+    "from their documents or the web."
+)
+
+# Session state key carrying the prefetched passages for one turn. ADK keeps
+# ``temp:`` state for the current invocation only and never persists it, so
+# the passages reach the model request without growing the session history.
+CONTEXT_STATE_KEY = "temp:document_context"
+
+
+def format_context(contexts: list[dict]) -> str:
+    """Render prefetched ``{text, source}`` contexts as a numbered block."""
+    return "\n\n".join(
+        f"[{i + 1}] (source: {c['source']})\n{c['text']}" for i, c in enumerate(contexts)
+    ) or "(no relevant passages were found in the user's documents)"
+
 
-def build_agent(corpus_name: str) -> LlmAgent:
-    """Return an LlmAgent whose retrieval tool is bound to ``corpus_name``."""
-    if corpus_name in _agent_cache:
-        return _agent_cache[corpus_name]
+def _inject_context(callback_context: CallbackContext, llm_request: LlmRequest) -> None:
+    """before_model_callback: add this turn's prefetched passages to the instructions."""
+    block = callback_context.state.get(CONTEXT_STATE_KEY)
+    if block:
+        llm_request.append_instructions([f"Document context:\n{block}"])
+
+
+def build_agent(
+    corpora: tuple[str, ...], prefetched: bool = False, tier: str = routing.STRONG
+) -> LlmAgent:
+    """Return an LlmAgent whose retrieval tool is bound to ``corpora``.
+
+    With ``prefetched`` the agent gets only ``web_search``: retrieval is done
+    up front by the runner's fast path, which hands the passages over in
+    ``CONTEXT_STATE_KEY``, so ``corpora`` is unused. ``tier`` picks the model
+    through ``model_for`` (see ``app.core.routing``). Agents are not cached here;
+    ``agent.runner`` keeps a bounded pool of prebuilt agent + Runner pairs.
+    """
+    model = model_for(tier)
+    if prefetched:
+        return LlmAgent(
+            name="rag_assistant",
+            model=model,
+            instruction=PREFETCHED_INSTRUCTION,
+            tools=[FunctionTool(web_search)],
+            before_model_callback=_inject_context,
+        )
 
     # Bind the corpus into the retrieval tool. partial keeps the LLM-visible
     # signature as just `query`. Give the wrapper a clean name/docstring so the
     # auto-generated tool schema is correct.
-    retrieve = partial(_retrieve_documents, corpus_name)
+    retrieve = partial(_retrieve_documents, corpora)
     retrieve.__name__ = "retrieve_documents"
     retrieve.__doc__ = (
         "Search the user's uploaded document corpus for passages relevant to "
         "the query. Returns a list of {text, source} contexts."
     )
 
-    agent = LlmAgent(
+    return LlmAgent(
         name="rag_assistant",
-        model=MODEL_ID,
+        model=model,
         instruction=INSTRUCTION,
         tools=[FunctionTool(retrieve), FunctionTool(web_search)],
     )
-    _agent_cache[corpus_name] = agent
-    return agent
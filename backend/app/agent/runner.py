@@ -1,110 +1,309 @@
-"""Run the RAG agent inside FastAPI: sessions, citations, and SSE streaming."""
+"""Run the RAG agent inside FastAPI: sessions, citations, and SSE streaming.
 
-import json
+Fast mode (``fast=True`` or ``AGENT_FAST_MODE``) starts corpus retrieval as
+soon as the request arrives, overlapping session setup, and hands the
+passages to the first model turn as per-invocation ``temp:`` state (they are
+added to the model's instructions, never stored in the session history).
+That skips the tool-calling round trip the agent otherwise spends deciding to
+call ``retrieve_documents``; ``web_search`` remains available as a fallback.
+
+Each turn is routed to the fast or strong model tier (``app.core.routing``)
+before its agent is picked. Fast-tier turns run in a scratch, in-memory copy
+of the conversation and are appended to the user's session once kept. A fast
+answer that opens like a non-answer is dropped with its copy (history and
+citations alike), and the turn is re-run on the strong tier in the session.
+"""
+
+import asyncio
+import time
 import uuid
+from collections import OrderedDict
 
 from google.genai import types
 from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService, Session
 from google.adk.agents.run_config import RunConfig, StreamingMode
 
-from app.config import APP_NAME, session_service
-from app.agent.rag_agent import build_agent
+from app.config import APP_NAME, get_session_service
+from app.core import capture, metrics, routing
+from app.settings import settings
+from app.agent.rag_agent import (
+    CONTEXT_STATE_KEY, build_agent, format_context, search_corpora, tool_result,
+)
 
 
 def _new_message(text: str) -> types.Content:
     return types.Content(role="user", parts=[types.Part(text=text)])
 
 
-async def _ensure_session(user_id: str, session_id: str | None) -> str:
-    """Return an existing session id or create a new one (per-user memory)."""
+def _is_message(event) -> bool:
+    return bool(event.content and any(p.text for p in event.content.parts or []))
+
+
+def _message_count(events) -> int:
+    """User and model messages in ``events``; tool calls and responses don't count."""
+    return sum(1 for e in events if _is_message(e))
+
+
+def _recent(events: list, messages: int) -> list:
+    """The tail of ``events`` holding the last ``messages`` messages.
+
+    It starts at a user message, so no tool call is cut off from its response.
+    """
+    count = 0
+    for i in range(len(events) - 1, -1, -1):
+        if _is_message(events[i]):
+            count += 1
+            if count >= messages and events[i].content.role == "user":
+                return events[i:]
+    return events
+
+
+async def _ensure_session(user_id: str, session_id: str | None) -> tuple[Session, int]:
+    """Return (session, prior messages): existing, or newly created (per-user memory)."""
     session_id = session_id or uuid.uuid4().hex
-    existing = await session_service.get_session(
+    sessions = get_session_service()
+    session = await sessions.get_session(
         app_name=APP_NAME, user_id=user_id, session_id=session_id
     )
-    if existing is None:
-        await session_service.create_session(
+    if session is None:
+        session = await sessions.create_session(
             app_name=APP_NAME, user_id=user_id, session_id=session_id
         )
-    return session_id
+    history = _message_count(session.events)
+    trace = capture.current()
+    if trace is not None:
+        trace.note(history=history)
+    return session, history
+
+
+# Fast-tier turns run on a throwaway copy of the conversation, so a discarded
+# attempt never reaches the user's session. Copies share one user id, which
+# keeps the in-memory service from accumulating an entry per user.
+_scratch_sessions = InMemorySessionService()
+_SCRATCH_USER = "scratch"
+
+
+async def _scratch_copy(session: Session) -> tuple[str, int]:
+    """Copy the recent part of ``session`` into the scratch service.
+
+    Only the last ``ROUTE_MAX_HISTORY`` messages are copied (deeper sessions
+    are never routed fast), so the cost doesn't grow with the conversation.
+    Returns the copy's id and the number of events it was seeded with.
+    """
+    scratch = await _scratch_sessions.create_session(
+        app_name=APP_NAME,
+        user_id=_SCRATCH_USER,
+        session_id=uuid.uuid4().hex,
+        state=dict(session.state),
+    )
+    events = _recent(session.events, settings.route_max_history)
+    for event in events:
+        await _scratch_sessions.append_event(scratch, event)
+    return scratch.id, len(events)
+
+
+async def _keep(session: Session, scratch_id: str, seeded: int) -> None:
+    """Append the turn run in scratch copy ``scratch_id`` to ``session``."""
+    scratch = await _scratch_sessions.get_session(
+        app_name=APP_NAME, user_id=_SCRATCH_USER, session_id=scratch_id
+    )
+    sessions = get_session_service()
+    for event in scratch.events[seeded:]:
+        await sessions.append_event(session, event)
+
+
+async def _drop(scratch_id: str | None) -> None:
+    if scratch_id is not None:
+        await _scratch_sessions.delete_session(
+            app_name=APP_NAME, user_id=_SCRATCH_USER, session_id=scratch_id
+        )
+
+
+def _citations_from_response(response: dict) -> list[dict]:
+    """Turn a tool response payload into UI-facing citations."""
+    citations: list[dict] = []
+    # retrieve_documents -> corpus citations
+    for ctx in response.get("contexts", []) or []:
+        citations.append({"source": ctx.get("source", "document"), "type": "corpus"})
+    # web_search -> web citations
+    for src in response.get("sources", []) or []:
+        citations.append(
+            {"source": src.get("title", src.get("url", "web")), "type": "web", "url": src.get("url")}
+        )
+    return citations
 
 
 def _citations_from_event(event) -> list[dict]:
     """Turn a tool-response event into UI-facing citations."""
     citations: list[dict] = []
     for fr in event.get_function_responses():
-        response = fr.response or {}
-        # retrieve_documents -> corpus citations
-        for ctx in response.get("contexts", []) or []:
-            citations.append({"source": ctx.get("source", "document"), "type": "corpus"})
-        # web_search -> web citations
-        for src in response.get("sources", []) or []:
-            citations.append(
-                {"source": src.get("title", src.get("url", "web")), "type": "web", "url": src.get("url")}
-            )
+        citations.extend(_citations_from_response(fr.response or {}))
     return citations
 
 
-def _runner(corpus_name: str) -> Runner:
-    return Runner(
-        app_name=APP_NAME,
-        agent=build_agent(corpus_name),
-        session_service=session_service,
-    )
-
+def _merge_citations(citations: list[dict], seen: set, new: list[dict]) -> None:
+    for c in new:
+        key = (c["source"], c["type"])
+        if key not in seen:
+            seen.add(key)
+            citations.append(c)
 
-async def run_query(user_id: str, corpus_name: str, session_id: str | None, text: str) -> dict:
-    """Non-streaming: return {answer, citations, session_id}."""
-    session_id = await _ensure_session(user_id, session_id)
-    runner = _runner(corpus_name)
 
-    answer_parts: list[str] = []
+def _fresh_citations(prefetched: list[dict]) -> tuple[list[dict], set]:
     citations: list[dict] = []
-    seen = set()
+    seen: set = set()
+    _merge_citations(citations, seen, prefetched)
+    return citations, seen
 
-    async for event in runner.run_async(
-        user_id=user_id, session_id=session_id, new_message=_new_message(text)
-    ):
-        for c in _citations_from_event(event):
-            key = (c["source"], c["type"])
-            if key not in seen:
-                seen.add(key)
-                citations.append(c)
-        if event.is_final_response() and event.content and event.content.parts:
-            answer_parts.extend(p.text for p in event.content.parts if p.text)
 
-    return {
-        "answer": "".join(answer_parts) or "I couldn't find an answer to your question.",
-        "citations": citations,
-        "session_id": session_id,
-    }
+def _trace_event(trace: capture.Trace, event) -> None:
+    """Record the tool calls and token usage carried by an ADK event."""
+    for call in event.get_function_calls():
+        trace.tool_call(call.name, dict(call.args or {}))
+    usage = event.usage_metadata
+    if usage is not None and not event.partial:
+        trace.tokens(prompt=usage.prompt_token_count, output=usage.candidates_token_count)
 
 
-async def stream_query(user_id: str, corpus_name: str, session_id: str | None, text: str):
-    """Async generator yielding Server-Sent Events.
+class RunnerPool:
+    """Size-bounded LRU of prebuilt agent + Runner pairs, keyed by corpora/mode/tier.
 
-    Emits ``data:`` lines carrying incremental text tokens, then a final
-    ``event: done`` line carrying citations and the session id.
+    Fast-tier Runners use the scratch session service (see ``_scratch_copy``).
+    Building an agent and its Runner is pure setup cost, so the most recently
+    used corpora keep theirs. Fast-mode agents carry no corpus binding (the
+    passages arrive per turn), so one pair per tier serves every user. The
+    least recently used pair is evicted once the pool is full, which keeps
+    memory flat however many users there are. A request holding an evicted
+    Runner simply finishes with it.
     """
-    session_id = await _ensure_session(user_id, session_id)
-    runner = _runner(corpus_name)
 
-    citations: list[dict] = []
-    seen = set()
-    streamed_any = False
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = max(maxsize, 1)
+        self._runners: OrderedDict[tuple[tuple[str, ...], bool, str], Runner] = OrderedDict()
+        self.hits = 0
+        self.builds = 0
+        self.evictions = 0
+
+    def get(
+        self, corpora: tuple[str, ...], fast: bool = False, tier: str = routing.STRONG
+    ) -> Runner:
+        if fast:
+            corpora = ()
+        key = (corpora, fast, tier)
+        runner = self._runners.get(key)
+        if runner is not None:
+            self._runners.move_to_end(key)
+            self.hits += 1
+            return runner
+
+        runner = Runner(
+            app_name=APP_NAME,
+            agent=build_agent(corpora, prefetched=fast, tier=tier),
+            session_service=(
+                _scratch_sessions if tier == routing.FAST else get_session_service()
+            ),
+        )
+        self.builds += 1
+        self._runners[key] = runner
+        if len(self._runners) > self.maxsize:
+            self._runners.popitem(last=False)
+            self.evictions += 1
+        return runner
 
+    def stats(self) -> dict:
+        return {
+            "size": len(self._runners),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "builds": self.builds,
+            "evictions": self.evictions,
+        }
+
+
+runner_pool = RunnerPool(settings.agent_pool_size)
+
+
+def _pool_metrics() -> list:
+    stats = runner_pool.stats()
+    return [
+        (
+            "ragai_agent_pool_events_total",
+            "Agent runner pool lookups and evictions.",
+            "counter",
+            [({"event": k}, stats[k]) for k in ("hits", "builds", "evictions")],
+        ),
+        ("ragai_agent_pool_size", "Prebuilt agent runners held.", "gauge", [({}, stats["size"])]),
+    ]
+
+
+metrics.register_collector(_pool_metrics)
+
+
+def _runner(corpora: tuple[str, ...], fast: bool = False, tier: str = routing.STRONG) -> Runner:
+    return runner_pool.get(corpora, fast, tier)
+
+
+async def _prepare(
+    user_id: str, corpora: tuple[str, ...], session_id: str | None, text: str, fast: bool
+) -> tuple[Session, dict | None, list[dict], routing.Decision]:
+    """Return (session, turn state, prefetched citations, route) for a turn."""
+    if not fast:
+        session, history = await _ensure_session(user_id, session_id)
+        # Retrieval happens inside the turn, so only query and history count.
+        return session, None, [], routing.decide("adk", text, history)
+
+    retrieval = asyncio.create_task(search_corpora(corpora, text))
+    try:
+        session, history = await _ensure_session(user_id, session_id)
+    except BaseException:
+        retrieval.cancel()
+        raise
+    contexts = await retrieval
+    found = tool_result(contexts)
+    return (
+        session,
+        {CONTEXT_STATE_KEY: format_context(found["contexts"])},
+        _citations_from_response(found),
+        routing.decide("adk", text, history, contexts or []),
+    )
+
+
+async def _answer(
+    runner: Runner, user_id: str, session_id: str, text: str, state: dict | None,
+    citations: list[dict], seen: set, trace: capture.Trace | None,
+) -> str:
+    answer_parts: list[str] = []
+    async for event in runner.run_async(
+        user_id=user_id, session_id=session_id, new_message=_new_message(text),
+        state_delta=state,
+    ):
+        _merge_citations(citations, seen, _citations_from_event(event))
+        if trace is not None:
+            _trace_event(trace, event)
+        if event.is_final_response() and event.content and event.content.parts:
+            answer_parts.extend(p.text for p in event.content.parts if p.text)
+    return "".join(answer_parts)
+
+
+async def _chunks(
+    runner: Runner, user_id: str, session_id: str, text: str, state: dict | None,
+    citations: list[dict], seen: set, trace: capture.Trace | None,
+):
+    """Yield the text deltas of one streamed turn."""
+    streamed_any = False
     run_config = RunConfig(streaming_mode=StreamingMode.SSE)
 
     async for event in runner.run_async(
         user_id=user_id,
         session_id=session_id,
         new_message=_new_message(text),
+        state_delta=state,
         run_config=run_config,
     ):
-        for c in _citations_from_event(event):
-            key = (c["source"], c["type"])
-            if key not in seen:
-                seen.add(key)
-                citations.append(c)
+        _merge_citations(citations, seen, _citations_from_event(event))
+        if trace is not None:
+            _trace_event(trace, event)
 
         if not (event.content and event.content.parts):
             continue
@@ -116,8 +315,147 @@ async def stream_query(user_id: str, corpus_name: str, session_id: str | None, t
         # back to streaming the single final response.
         if event.partial:
             streamed_any = True
-            yield f"data: {json.dumps({'token': chunk})}\n\n"
-        elif event.is_final_response() and not streamed_any:
-            yield f"data: {json.dumps({'token': chunk})}\n\n"
+        elif not (event.is_final_response() and not streamed_any):
+            continue
+        yield chunk
+
+
+async def _chain(held: list[str], chunks):
+    for chunk in held:
+        yield chunk
+    async for chunk in chunks:
+        yield chunk
+
+
+async def _probe(chunks) -> list[str]:
+    """Read ahead up to ROUTE_PROBE_CHARS of a stream (it stays open)."""
+    held, size = [], 0
+    async for chunk in chunks:
+        held.append(chunk)
+        size += len(chunk)
+        if size >= settings.route_probe_chars:
+            break
+    return held
+
+
+async def run_query(
+    user_id: str, corpora: tuple[str, ...], session_id: str | None, text: str, fast: bool = False
+) -> dict:
+    """Non-streaming: return {answer, citations, session_id}."""
+    start = time.perf_counter()
+    trace = capture.start("adk", "query", text, user=user_id, fast=fast, corpora=len(corpora))
+    scratch_id = None
+    try:
+        session, state, prefetched, decision = await _prepare(
+            user_id, corpora, session_id, text, fast
+        )
+        citations, seen = _fresh_citations(prefetched)
+
+        generating = time.perf_counter()
+        answer = None
+        if decision.tier == routing.FAST:
+            scratch_id, seeded = await _scratch_copy(session)
+            answer = await _answer(
+                _runner(corpora, fast, decision.tier), _SCRATCH_USER, scratch_id, text, state,
+                citations, seen, trace,
+            )
+            if routing.should_escalate(decision, answer):
+                decision = routing.escalate("adk", decision, time.perf_counter() - generating)
+                citations, seen = _fresh_citations(prefetched)
+                answer = None
+            else:
+                await _keep(session, scratch_id, seeded)
+        if answer is None:
+            answer = await _answer(
+                _runner(corpora, fast, decision.tier), user_id, session.id, text, state,
+                citations, seen, trace,
+            )
+        routing.observe("adk", decision, time.perf_counter() - generating)
+    except BaseException as exc:
+        if trace is not None:
+            trace.fail(exc)
+        raise
+    finally:
+        await _drop(scratch_id)
+
+    metrics.stage("total", "adk").observe(time.perf_counter() - start)
+    answer = answer or "I couldn't find an answer to your question."
+    if trace is not None:
+        routing.note(trace, decision)
+        trace.finish(answer)
+    return {"answer": answer, "citations": citations, "session_id": session.id}
+
+
+async def stream_query(
+    user_id: str, corpora: tuple[str, ...], session_id: str | None, text: str, fast: bool = False
+):
+    """Async generator yielding incremental text tokens, then a done payload.
+
+    Tokens are ``str``; the last item is ``{citations, session_id}``.
+    ``app.core.sse.event_stream`` encodes the sequence as Server-Sent Events.
+    """
+    start = time.perf_counter()
+    trace = capture.start("adk", "stream", text, user=user_id, fast=fast, corpora=len(corpora))
+    chunks = None
+    scratch_id = None
+    kept = False
+    try:
+        session, state, prefetched, decision = await _prepare(
+            user_id, corpora, session_id, text, fast
+        )
+        citations, seen = _fresh_citations(prefetched)
+        first_token = True
+        answer_parts: list[str] = []
+
+        generating = time.perf_counter()
+        held: list[str] = []
+        if decision.tier == routing.FAST:
+            scratch_id, seeded = await _scratch_copy(session)
+            chunks = _chunks(
+                _runner(corpora, fast, decision.tier), _SCRATCH_USER, scratch_id, text, state,
+                citations, seen, trace,
+            )
+            if settings.route_escalate:
+                # Nothing reaches the client until the opening looks like an answer.
+                held = await _probe(chunks)
+                if routing.low_confidence("".join(held)):
+                    await chunks.aclose()
+                    decision = routing.escalate("adk", decision, time.perf_counter() - generating)
+                    citations, seen = _fresh_citations(prefetched)
+                    held, chunks = [], None
+            # Committed to the fast answer: the turn is kept even if the
+            # client leaves part-way through it.
+            kept = decision.tier == routing.FAST
+        if chunks is None:
+            chunks = _chunks(
+                _runner(corpora, fast, decision.tier), user_id, session.id, text, state,
+                citations, seen, trace,
+            )
+
+        async for chunk in _chain(held, chunks):
+            if first_token:
+                first_token = False
+                ttft = time.perf_counter() - start
+                metrics.stage("ttft", "adk").observe(ttft)
+                if trace is not None:
+                    trace.stage("ttft", ttft)
+            if trace is not None:
+                answer_parts.append(chunk)
+            yield chunk
+        routing.observe("adk", decision, time.perf_counter() - generating)
+    except BaseException as exc:
+        if trace is not None:
+            trace.fail(exc)
+        raise
+    finally:
+        if chunks is not None:
+            await chunks.aclose()
+        if kept:
+            await _keep(session, scratch_id, seeded)
+        await _drop(scratch_id)
 
-    yield f"event: done\ndata: {json.dumps({'citations': citations, 'session_id': session_id})}\n\n"
+    metrics.stage("total", "adk").observe(time.perf_counter() - start)
+    if trace is not None:
+        routing.note(trace, decision)
+        trace.finish("".join(answer_parts))
+    yield {"citations": citations, "session_id": session.id}
@@ -0,0 +1,308 @@
+"""Durable ADK session storage so the online agent can run on many workers.
+
+``MongoSessionService`` keeps conversation history in the same MongoDB as the
+users collection. Every lookup goes through a unique compound index on
+``(app_name, user_id, session_id)``, and documents carry an ``expires_at``
+field with a TTL index, so idle conversations are removed by MongoDB itself.
+Each flush pushes ``expires_at`` forward on the session and all its events
+together, so an active conversation never loses its early turns.
+
+Events are written behind: ``append_event`` updates the in-memory ``Session``
+straight away and queues the event. The queue is flushed in a single
+``insert_many`` when the turn's final response arrives, when it reaches
+``session_flush_max_events``, or after ``session_flush_interval`` seconds.
+Any worker that later loads the session therefore sees the whole turn.
+
+``build_session_service`` picks the backend from ``settings.session_backend``;
+``sql`` delegates to ADK's ``DatabaseSessionService`` (e.g. SQLite locally).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import copy
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, InMemorySessionService, Session, State
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+
+from app.core import db as mongo
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+_SESSIONS = "sessions"
+_EVENTS = "session_events"
+
+
+def _key(app_name: str, user_id: str, session_id: str) -> tuple[str, str, str]:
+    return (app_name, user_id, session_id)
+
+
+def _filter(app_name: str, user_id: str, session_id: str) -> dict:
+    return {"app_name": app_name, "user_id": user_id, "session_id": session_id}
+
+
+class MongoSessionService(BaseSessionService):
+    """ADK session service persisted to MongoDB with write-behind event batching."""
+
+    def __init__(
+        self,
+        db,
+        *,
+        ttl: timedelta,
+        flush_interval: float = 1.0,
+        flush_max_events: int = 50,
+    ) -> None:
+        self._sessions = db[_SESSIONS]
+        self._events = db[_EVENTS]
+        self._ttl = ttl
+        self._flush_interval = flush_interval
+        self._flush_max_events = flush_max_events
+
+        # (app, user, session) -> {"events": [...], "state": {...}, "last_update_time": float}
+        self._pending: dict[tuple[str, str, str], dict[str, Any]] = {}
+        self._lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+        self._indexes_ready = False
+
+    # --- Setup -------------------------------------------------------------
+
+    async def ensure_indexes(self) -> None:
+        if self._indexes_ready:
+            return
+        keys = [("app_name", ASCENDING), ("user_id", ASCENDING), ("session_id", ASCENDING)]
+        await self._sessions.create_index(keys, unique=True)
+        await self._sessions.create_index("expires_at", expireAfterSeconds=0)
+        await self._events.create_index([*keys, ("timestamp", ASCENDING)])
+        await self._events.create_index("expires_at", expireAfterSeconds=0)
+        self._indexes_ready = True
+
+    def _expires_at(self) -> datetime:
+        return datetime.now(timezone.utc) + self._ttl
+
+    # --- BaseSessionService ------------------------------------------------
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        await self.ensure_indexes()
+        session_id = (session_id or "").strip() or uuid.uuid4().hex
+        now = time.time()
+        try:
+            await self._sessions.insert_one(
+                {
+                    **_filter(app_name, user_id, session_id),
+                    "state": state or {},
+                    "last_update_time": now,
+                    "expires_at": self._expires_at(),
+                }
+            )
+        except DuplicateKeyError:
+            # A concurrent request created the same session first (callers do
+            # get-then-create); use that one rather than failing the turn.
+            existing = await self.get_session(
+                app_name=app_name, user_id=user_id, session_id=session_id
+            )
+            if existing is not None:
+                return existing
+            raise
+        return Session(
+            id=session_id,
+            app_name=app_name,
+            user_id=user_id,
+            state=copy.deepcopy(state or {}),
+            events=[],
+            last_update_time=now,
+        )
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        await self.ensure_indexes()
+        # Never serve a session from Mongo while this process still holds
+        # unwritten events for it.
+        await self._flush_keys([_key(app_name, user_id, session_id)])
+
+        doc = await self._sessions.find_one(
+            _filter(app_name, user_id, session_id), projection={"_id": 0, "expires_at": 0}
+        )
+        if doc is None:
+            return None
+
+        query = _filter(app_name, user_id, session_id)
+        if config and config.after_timestamp:
+            query["timestamp"] = {"$gte": config.after_timestamp}
+        cursor = self._events.find(query, projection={"_id": 0, "event": 1})
+        if config and config.num_recent_events:
+            cursor = cursor.sort("timestamp", -1).limit(config.num_recent_events)
+            events = [Event.model_validate(d["event"]) async for d in cursor]
+            events.reverse()
+        else:
+            cursor = cursor.sort("timestamp", 1)
+            events = [Event.model_validate(d["event"]) async for d in cursor]
+
+        return Session(
+            id=session_id,
+            app_name=app_name,
+            user_id=user_id,
+            state=doc.get("state") or {},
+            events=events,
+            last_update_time=doc.get("last_update_time", 0.0),
+        )
+
+    async def list_sessions(
+        self, *, app_name: str, user_id: Optional[str] = None
+    ) -> ListSessionsResponse:
+        await self.ensure_indexes()
+        query = {"app_name": app_name}
+        if user_id is not None:
+            query["user_id"] = user_id
+        cursor = self._sessions.find(query, projection={"_id": 0, "expires_at": 0})
+        sessions = [
+            Session(
+                id=d["session_id"],
+                app_name=d["app_name"],
+                user_id=d["user_id"],
+                state=d.get("state") or {},
+                events=[],
+                last_update_time=d.get("last_update_time", 0.0),
+            )
+            async for d in cursor
+        ]
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        async with self._lock:
+            self._pending.pop(_key(app_name, user_id, session_id), None)
+        query = _filter(app_name, user_id, session_id)
+        await self._events.delete_many(query)
+        await self._sessions.delete_one(query)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        # Base class applies the state delta and appends to session.events.
+        event = await super().append_event(session, event)
+        session.last_update_time = event.timestamp
+
+        key = _key(session.app_name, session.user_id, session.id)
+        async with self._lock:
+            entry = self._pending.setdefault(key, {"events": []})
+            entry["events"].append(
+                {
+                    **_filter(*key),
+                    "timestamp": event.timestamp,
+                    "event": event.model_dump(mode="json", exclude_none=True),
+                }
+            )
+            # temp: keys live for the current invocation only (ADK semantics).
+            entry["state"] = {
+                k: copy.deepcopy(v)
+                for k, v in session.state.items()
+                if not k.startswith(State.TEMP_PREFIX)
+            }
+            entry["last_update_time"] = session.last_update_time
+            size = len(entry["events"])
+
+        if event.is_final_response() or size >= self._flush_max_events:
+            await self._flush_keys([key])
+        else:
+            self._ensure_flusher()
+        return event
+
+    # --- Write-behind ------------------------------------------------------
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        while self._pending:
+            await asyncio.sleep(self._flush_interval)
+            try:
+                await self.flush()
+            except Exception:  # noqa: BLE001 - keep buffering; retried next tick
+                logger.exception("Session event flush failed")
+
+    async def flush(self) -> None:
+        """Write every buffered event to MongoDB."""
+        await self._flush_keys(list(self._pending))
+
+    async def _flush_keys(self, keys: list[tuple[str, str, str]]) -> None:
+        async with self._lock:
+            batch = {k: self._pending.pop(k) for k in keys if k in self._pending}
+        for key, entry in batch.items():
+            expires_at = self._expires_at()
+            docs = [{**e, "expires_at": expires_at} for e in entry["events"]]
+            try:
+                if docs:
+                    await self._events.insert_many(docs, ordered=True)
+                await self._events.update_many(
+                    {**_filter(*key), "expires_at": {"$lt": expires_at}},
+                    {"$set": {"expires_at": expires_at}},
+                )
+                await self._sessions.update_one(
+                    _filter(*key),
+                    {
+                        "$set": {
+                            "state": entry["state"],
+                            "last_update_time": entry["last_update_time"],
+                            "expires_at": expires_at,
+                        }
+                    },
+                )
+            except Exception:
+                # Put the batch back (ahead of anything newer) so it is not lost.
+                async with self._lock:
+                    newer = self._pending.pop(key, None)
+                    if newer:
+                        entry["events"].extend(newer["events"])
+                        entry["state"] = newer["state"]
+                        entry["last_update_time"] = newer["last_update_time"]
+                    self._pending[key] = entry
+                raise
+
+
+def build_session_service() -> BaseSessionService:
+    """Return the session service selected by ``settings.session_backend``."""
+    backend = settings.session_backend.lower() or ("mongo" if settings.mongo_uri else "memory")
+
+    if backend == "mongo":
+        if not mongo.configured():
+            logger.warning("SESSION_BACKEND=mongo but MONGO_URI is unset; using in-memory sessions")
+            return InMemorySessionService()
+        logger.info("Agent sessions stored in MongoDB")
+        return MongoSessionService(
+            mongo.database(),
+            ttl=timedelta(hours=settings.session_ttl_hours),
+            flush_interval=settings.session_flush_interval,
+            flush_max_events=settings.session_flush_max_events,
+        )
+
+    if backend == "sql":
+        from google.adk.sessions import DatabaseSessionService
+
+        logger.info("Agent sessions stored in %s", settings.session_db_url.split("://", 1)[0])
+        return DatabaseSessionService(db_url=settings.session_db_url)
+
+    if backend != "memory":
+        logger.warning("Unknown SESSION_BACKEND=%r; using in-memory sessions", backend)
+    return InMemorySessionService()
@@ -5,9 +5,9 @@ from app.services.auth_service import signup_user, signin_user
 router = APIRouter()
 
 @router.post("/signup")
-def signup(data: UserSignup):
-    return signup_user(data)
+async def signup(data: UserSignup):
+    return await signup_user(data)
 
 @router.post("/signin")
-def signin(data: UserLogin):
-    return signin_user(data)
\ No newline at end of file
+async def signin(data: UserLogin):
+    return await signin_user(data)
\ No newline at end of file
@@ -10,15 +10,15 @@ router = APIRouter()
 
 
 @router.post("/upload-file")
-def upload_file(file: UploadFile = File(...), user=Depends(get_current_user)):
-    return upload_user_file(user["sub"], file)
+async def upload_file(file: UploadFile = File(...), user=Depends(get_current_user)):
+    return await upload_user_file(user, file)
 
 
 @router.delete("/delete-file")
-def delete_file(request: DeleteFileRequest, user=Depends(get_current_user)):
-    return delete_user_file(user["sub"], request)
+async def delete_file(request: DeleteFileRequest, user=Depends(get_current_user)):
+    return await delete_user_file(user, request)
 
 
 @router.get("/documents")
-def documents(user=Depends(get_current_user)):
-    return list_user_files(user["sub"])
+async def documents(user=Depends(get_current_user)):
+    return await list_user_files(user)
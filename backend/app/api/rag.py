@@ -1,40 +1,107 @@
-from fastapi import APIRouter, Depends, HTTPException
+import importlib
+
+from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
-import app.config as config
-from app.models.schemas import TextRequest
+from app.models.schemas import BatchRetrieveRequest, TextRequest
+from app.core import admission
+from app.core.sse import event_stream
+from app.settings import settings
 from app.core.security import get_current_user
-from app.services.rag_service import retrieve_context_service
-from app.agent.runner import run_query, stream_query
+from app.services.rag_service import (
+    resolve_corpora,
+    retrieve_batch_service,
+    retrieve_context_service,
+    stream_retrieve_batch,
+)
 
 router = APIRouter()
+_agent_runner = None
+
+
+async def _get_corpora(user: dict) -> tuple[str, ...]:
+    # Own corpus plus granted shared corpora, normally served from the JWT
+    # claim and cache without a Mongo round trip.
+    return await resolve_corpora(user)
+
+
+def _fast(request: TextRequest) -> bool:
+    return settings.agent_fast_mode if request.fast is None else request.fast
+
+
+def _priority(request: TextRequest, interactive: int) -> int:
+    return admission.BATCH if request.batch else interactive
 
 
-def _get_corpus(username: str) -> str:
-    if config.users is None:
-        raise HTTPException(status_code=503, detail="Online mode is not configured")
-    user = config.users.find_one({"username": username})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user["corpus"]
+async def _runner():
+    # The agent stack (google.adk) takes seconds to import. main warms it up in
+    # the background, but a request can arrive first, so load it in a worker
+    # thread rather than stalling the event loop.
+    global _agent_runner
+    if _agent_runner is None:
+        _agent_runner = await run_in_threadpool(importlib.import_module, "app.agent.runner")
+    return _agent_runner
+
+
+async def _holding(slot: admission.Slot, stream):
+    # The generation slot is held until the stream ends or the client leaves.
+    try:
+        async for chunk in stream:
+            yield chunk
+    finally:
+        slot.release()
 
 
 @router.post("/retrieve")
-def retrieve_context(request: TextRequest, user=Depends(get_current_user)):
-    return retrieve_context_service(user["sub"], request.text)
+async def retrieve_context(request: TextRequest, user=Depends(get_current_user)):
+    return await retrieve_context_service(user, request.text)
+
+
+@router.post("/retrieve-batch")
+async def retrieve_context_batch(request: BatchRetrieveRequest, user=Depends(get_current_user)):
+    corpora = await _get_corpora(user)
+    if request.stream:
+        return StreamingResponse(
+            stream_retrieve_batch(corpora, request.queries),
+            media_type="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    return await retrieve_batch_service(corpora, request.queries)
 
 
 @router.post("/query")
 async def ask_with_gemini(request: TextRequest, user=Depends(get_current_user)):
-    corpus = _get_corpus(user["sub"])
-    return await run_query(user["sub"], corpus, request.session_id, request.text)
+    runner = await _runner()
+    corpora = await _get_corpora(user)
+    slot = await admission.gate("adk").acquire(
+        user["sub"], _priority(request, admission.STANDARD)
+    )
+    with slot:
+        return await runner.run_query(
+            user["sub"], corpora, request.session_id, request.text, fast=_fast(request)
+        )
 
 
 @router.post("/stream")
 async def ask_with_gemini_stream(request: TextRequest, user=Depends(get_current_user)):
-    corpus = _get_corpus(user["sub"])
+    runner = await _runner()
+    corpora = await _get_corpora(user)
+    slot = await admission.gate("adk").acquire(
+        user["sub"], _priority(request, admission.INTERACTIVE)
+    )
     return StreamingResponse(
-        stream_query(user["sub"], corpus, request.session_id, request.text),
+        _holding(
+            slot,
+            event_stream(
+                runner.stream_query(
+                    user["sub"], corpora, request.session_id, request.text, fast=_fast(request)
+                )
+            ),
+        ),
         media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also runs if the body was never iterated; release is idempotent.
+        background=BackgroundTask(slot.release),
     )
@@ -0,0 +1,34 @@
+"""Shared organisation corpus routes (authenticated)."""
+
+from fastapi import APIRouter, Depends, File, UploadFile
+
+from app.models.schemas import SharedCorpusCreate, SharedCorpusGrant
+from app.services.shared_service import (
+    create_shared_corpus,
+    grant_shared_corpus,
+    list_shared_corpora,
+    upload_shared_file,
+)
+from app.core.security import get_current_user
+
+router = APIRouter()
+
+
+@router.post("/corpora")
+async def create_corpus(data: SharedCorpusCreate, user=Depends(get_current_user)):
+    return await create_shared_corpus(user["sub"], data)
+
+
+@router.get("/corpora")
+async def corpora(user=Depends(get_current_user)):
+    return await list_shared_corpora(user["sub"])
+
+
+@router.post("/corpora/{name}/members")
+async def grant(name: str, data: SharedCorpusGrant, user=Depends(get_current_user)):
+    return await grant_shared_corpus(user["sub"], name, data)
+
+
+@router.post("/corpora/{name}/upload-file")
+async def upload_file(name: str, file: UploadFile = File(...), user=Depends(get_current_user)):
+    return await upload_shared_file(user["sub"], name, file)
@@ -1,20 +1,20 @@
 """Shared clients and configuration.
 
-Cloud clients (Vertex AI, Gemini, MongoDB) are initialised lazily and guarded so
-the application still boots when only the offline (Ollama) stack is configured.
-Names exported here (``client``, ``users``, ``MODEL_ID`` …) are imported across
-the online modules; in an offline-only deployment they are ``None`` and the
-online routes fail gracefully at request time rather than at import time.
+Cloud clients (Vertex AI, Gemini) and the ADK session service are created on
+first use through ``get_client`` / ``get_session_service``, so importing this
+module never pulls in ``vertexai``, ``google.genai`` or ``google.adk``. An
+offline-only deployment therefore never loads the online SDKs, and an online
+one starts serving ``/health`` before they have finished loading (``main``
+warms them up in the background). ``get_client`` returns ``None`` when cloud
+config is absent or initialisation failed; the online routes then fail
+gracefully at request time rather than at import time. MongoDB access lives
+in ``app.core.db``.
 """
 
 import logging
 import os
 import tempfile
-
-import vertexai
-from google import genai
-from google.adk.sessions import InMemorySessionService
-from pymongo import MongoClient
+import threading
 
 from app.settings import settings
 
@@ -33,8 +33,13 @@ MODEL_ID = settings.model_id
 APP_NAME = "ragai"
 
 # --- Vertex AI / Gemini (online) ---
-client: genai.Client | None = None
-if settings.cloud_enabled:
+_client = None
+_client_state = "disabled" if not settings.cloud_enabled else "cold"
+_session_service = None
+_init_lock = threading.Lock()
+
+
+def _init_client():
     # Credential resolution order:
     #   1. Inline JSON (GOOGLE_CREDENTIALS_JSON) — written to a temp file. Used by
     #      hosts that pass secrets as env vars (e.g. Azure Container Apps).
@@ -51,27 +56,76 @@ if settings.cloud_enabled:
     os.environ["GOOGLE_GENAI_USE_VERTEXAI"] = "TRUE"
     os.environ["GOOGLE_CLOUD_PROJECT"] = PROJECT_ID
     os.environ["GOOGLE_CLOUD_LOCATION"] = LOCATION
-    try:
-        vertexai.init(project=PROJECT_ID, location=LOCATION)
-        client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
-        logger.info("Vertex AI initialised (project=%s, location=%s)", PROJECT_ID, LOCATION)
-    except Exception:  # pragma: no cover - depends on external cloud state
-        logger.exception("Failed to initialise Vertex AI; online mode disabled")
-        client = None
-else:
-    logger.warning("Cloud config absent; online mode disabled, offline mode only")
 
-# ADK session service (in-memory conversation history for the online agent).
-session_service = InMemorySessionService()
-
-# --- MongoDB (online users) ---
-mongo_client: MongoClient | None = None
-db = None
-users = None
-if settings.mongo_uri:
-    try:
-        mongo_client = MongoClient(settings.mongo_uri)
-        db = mongo_client["ragai"]
-        users = db["users"]
-    except Exception:  # pragma: no cover
-        logger.exception("Failed to connect to MongoDB; online auth disabled")
+    import vertexai
+    from google import genai
+
+    vertexai.init(project=PROJECT_ID, location=LOCATION)
+    client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
+    logger.info("Vertex AI initialised (project=%s, location=%s)", PROJECT_ID, LOCATION)
+    return client
+
+
+def get_client():
+    """Return the shared ``genai.Client``, initialising Vertex AI on first call.
+
+    ``None`` when cloud config is absent or initialisation failed.
+    """
+    global _client, _client_state
+    if _client_state != "cold":
+        return _client
+    with _init_lock:
+        if _client_state == "cold":
+            try:
+                _client = _init_client()
+                _client_state = "ready"
+            except Exception:  # pragma: no cover - depends on external cloud state
+                logger.exception("Failed to initialise Vertex AI; online mode disabled")
+                _client_state = "failed"
+    return _client
+
+
+def vertex_rag():
+    """Return the ``vertexai.rag`` module, initialising Vertex AI first."""
+    get_client()
+    from vertexai import rag
+
+    return rag
+
+
+def client_state() -> str:
+    """``disabled``, ``cold`` (not initialised yet), ``ready`` or ``failed``."""
+    return _client_state
+
+
+def get_session_service():
+    """ADK session service (conversation history for the online agent).
+
+    Shared (MongoDB/SQL) backends let several workers or replicas serve one
+    conversation. Built on first use.
+    """
+    global _session_service
+    if _session_service is None:
+        with _init_lock:
+            if _session_service is None:
+                from app.agent.sessions import build_session_service
+
+                _session_service = build_session_service()
+    return _session_service
+
+
+def use_session_service(service) -> None:
+    """Replace the session service (e.g. with a local stand-in in load tests)."""
+    global _session_service
+    _session_service = service
+
+
+async def flush_sessions() -> None:
+    """Persist write-behind session events, if a buffering service is in use."""
+    flush = getattr(_session_service, "flush", None)
+    if flush is not None:
+        await flush()
+
+
+if not settings.cloud_enabled:
+    logger.warning("Cloud config absent; online mode disabled, offline mode only")
@@ -0,0 +1,329 @@
+"""Admission control for LLM-bound work: concurrency limits and fair queuing.
+
+Each backend (``adk`` for Gemini via the agent runner, ``ollama`` for the
+local model) has a ``Gate`` with a fixed number of generation slots. A request
+that finds every slot busy waits in a bounded queue, ordered like this:
+
+  * by priority: ``INTERACTIVE`` (SSE streams, someone is watching tokens
+    arrive) before ``STANDARD`` (non-streaming queries) before ``BATCH``
+    (scripts, benchmarks, bulk jobs);
+  * within a priority, round-robin across users, so one user's burst can't
+    starve everyone else; a user may also hold at most
+    ``ADMISSION_USER_QUEUE`` waiting requests.
+
+A request is rejected with ``429`` and a ``Retry-After`` header when:
+
+  * the queue is full;
+  * the user already has too many requests waiting;
+  * the estimated wait already exceeds ``ADMISSION_MAX_WAIT_SECONDS``, so it
+    fails fast instead of timing out later;
+  * it actually waits that long without getting a slot.
+
+The wait estimate is the number of requests ahead of it times a moving
+average of slot hold time, divided by the slot count.
+
+Slots are granted under a plain lock and handed to waiters either as an
+``asyncio`` future (``await gate.acquire(...)``) or a thread event
+(``gate.enter(...)``), so the async agent runner and the sync offline
+pipeline share one gate per backend. A slot limit of 0 disables the gate.
+
+Metrics: ``ragai_admission_wait_seconds`` (histogram by backend/priority),
+``ragai_admission_requests_total`` (by backend/result), and the gauges
+``ragai_admission_queue_depth`` and ``ragai_admission_in_flight``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+
+from fastapi import HTTPException
+
+from app.core import metrics
+from app.settings import settings
+
+INTERACTIVE, STANDARD, BATCH = 0, 1, 2
+PRIORITY_NAMES = ("interactive", "standard", "batch")
+
+WAIT_SECONDS = metrics.Histogram(
+    "ragai_admission_wait_seconds",
+    "Time LLM-bound requests waited for a generation slot.",
+    ("backend", "priority"),
+)
+REQUESTS = metrics.Counter(
+    "ragai_admission_requests_total",
+    "Admission decisions by backend and result.",
+    ("backend", "result"),
+)
+
+
+class Rejected(HTTPException):
+    """429 with ``Retry-After``: the backend is saturated; try again later."""
+
+    def __init__(self, backend: str, reason: str, retry_after: float) -> None:
+        seconds = max(1, math.ceil(retry_after))
+        super().__init__(
+            status_code=429,
+            detail=f"The {backend} model is busy ({reason}); retry in {seconds}s",
+            headers={"Retry-After": str(seconds)},
+        )
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ("user", "priority", "enqueued", "granted", "_future", "_loop", "_event")
+
+    def __init__(self, user: str, priority: int, sync: bool) -> None:
+        self.user = user
+        self.priority = priority
+        self.enqueued = time.perf_counter()
+        self.granted = False
+        if sync:
+            self._event = threading.Event()
+            self._future = self._loop = None
+        else:
+            self._event = None
+            self._loop = asyncio.get_running_loop()
+            self._future = self._loop.create_future()
+
+    def wake(self) -> None:
+        # Called with the gate lock held, possibly from another thread.
+        self.granted = True
+        if self._event is not None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(_resolve, self._future)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class Slot:
+    """A held generation slot; release exactly once (further calls are no-ops)."""
+
+    __slots__ = ("_gate", "_start", "_released")
+
+    def __init__(self, gate: "Gate | None") -> None:
+        self._gate = gate
+        self._start = time.perf_counter()
+        self._released = False
+
+    def release(self) -> None:
+        if self._released or self._gate is None:
+            return
+        self._released = True
+        self._gate._release(time.perf_counter() - self._start)
+
+    def __enter__(self) -> "Slot":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+    async def __aenter__(self) -> "Slot":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.release()
+
+
+class Gate:
+    """Slot limit, bounded priority queue and per-user round-robin for one backend."""
+
+    def __init__(
+        self,
+        backend: str,
+        limit: int,
+        queue_size: int,
+        user_queue: int,
+        max_wait: float,
+        initial_hold: float = 5.0,
+    ) -> None:
+        self.backend = backend
+        self.limit = limit
+        self.queue_size = queue_size
+        self.user_queue = user_queue
+        self.max_wait = max_wait
+        self.in_flight = 0
+        # priority -> user -> that user's waiters (FIFO); users rotate after each grant.
+        self._queues: list[OrderedDict[str, deque[_Waiter]]] = [
+            OrderedDict() for _ in PRIORITY_NAMES
+        ]
+        self._depth = [0] * len(PRIORITY_NAMES)
+        self._per_user: dict[str, int] = {}
+        self._hold = initial_hold  # moving average of slot hold time, seconds
+        self._lock = threading.Lock()
+
+    # --- Public API -------------------------------------------------------------
+
+    async def acquire(self, user: str, priority: int = STANDARD) -> Slot:
+        """Wait (asynchronously) for a slot, or raise ``Rejected``."""
+        if self.limit <= 0:
+            return Slot(None)
+        waiter = self._admit_or_enqueue(user, priority, sync=False)
+        if waiter is None:
+            return self._granted(priority, 0.0)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter._future), self.max_wait)
+        except asyncio.TimeoutError:
+            self._give_up(waiter)
+        except asyncio.CancelledError:
+            # Client went away while queued; hand the slot on if it just arrived.
+            if not self._withdraw(waiter):
+                self._release(None)
+            raise
+        return self._granted(priority, time.perf_counter() - waiter.enqueued)
+
+    def enter(self, user: str, priority: int = STANDARD) -> Slot:
+        """Blocking variant of ``acquire`` for worker threads."""
+        if self.limit <= 0:
+            return Slot(None)
+        waiter = self._admit_or_enqueue(user, priority, sync=True)
+        if waiter is None:
+            return self._granted(priority, 0.0)
+        if not waiter._event.wait(self.max_wait):
+            self._give_up(waiter)
+        return self._granted(priority, time.perf_counter() - waiter.enqueued)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "queued": dict(zip(PRIORITY_NAMES, self._depth)),
+                "avg_hold_seconds": round(self._hold, 3),
+            }
+
+    # --- Internals (all queue state is guarded by _lock) --------------------------
+
+    def _admit_or_enqueue(self, user: str, priority: int, sync: bool) -> _Waiter | None:
+        with self._lock:
+            if self.in_flight < self.limit and not any(self._depth):
+                self.in_flight += 1
+                return None
+            ahead = sum(self._depth[: priority + 1])
+            estimate = (ahead + 1) * self._hold / self.limit
+            if sum(self._depth) >= self.queue_size:
+                reason = "queue_full"
+            elif self._per_user.get(user, 0) >= self.user_queue:
+                reason = "user_limit"
+            elif estimate > self.max_wait:
+                reason = "deadline"
+            else:
+                waiter = _Waiter(user, priority, sync)
+                self._queues[priority].setdefault(user, deque()).append(waiter)
+                self._depth[priority] += 1
+                self._per_user[user] = self._per_user.get(user, 0) + 1
+                return waiter
+        self._reject(reason, estimate)
+
+    def _granted(self, priority: int, waited: float) -> Slot:
+        WAIT_SECONDS.labels(self.backend, PRIORITY_NAMES[priority]).observe(waited)
+        REQUESTS.labels(self.backend, "admitted").inc()
+        return Slot(self)
+
+    def _reject(self, reason: str, retry_after: float) -> None:
+        REQUESTS.labels(self.backend, reason).inc()
+        raise Rejected(self.backend, reason.replace("_", " "), retry_after)
+
+    def _give_up(self, waiter: _Waiter) -> None:
+        """Deadline passed: leave the queue, unless a slot arrived meanwhile."""
+        if self._withdraw(waiter):
+            with self._lock:
+                retry = (sum(self._depth) + 1) * self._hold / self.limit
+            self._reject("timeout", retry)
+
+    def _withdraw(self, waiter: _Waiter) -> bool:
+        """Remove a waiter that was never granted; False if it already holds a slot."""
+        with self._lock:
+            if waiter.granted:
+                return False
+            users = self._queues[waiter.priority]
+            mine = users.get(waiter.user)
+            if mine is not None and waiter in mine:
+                mine.remove(waiter)
+                if not mine:
+                    del users[waiter.user]
+                self._dequeued(waiter)
+            return True
+
+    def _dequeued(self, waiter: _Waiter) -> None:
+        self._depth[waiter.priority] -= 1
+        left = self._per_user[waiter.user] - 1
+        if left:
+            self._per_user[waiter.user] = left
+        else:
+            del self._per_user[waiter.user]
+
+    def _release(self, held: float | None) -> None:
+        with self._lock:
+            if held is not None:
+                self._hold += 0.2 * (held - self._hold)
+            for users in self._queues:
+                if users:
+                    user, mine = next(iter(users.items()))
+                    waiter = mine.popleft()
+                    if mine:
+                        users.move_to_end(user)  # round-robin: next user goes first
+                    else:
+                        del users[user]
+                    self._dequeued(waiter)
+                    waiter.wake()  # the slot passes straight to the waiter
+                    return
+            self.in_flight -= 1
+
+
+def _gate(backend: str, limit: int) -> Gate:
+    return Gate(
+        backend,
+        limit,
+        settings.admission_queue_size,
+        settings.admission_user_queue,
+        settings.admission_max_wait_seconds,
+    )
+
+
+gates: dict[str, Gate] = {
+    "adk": _gate("adk", settings.admission_adk_limit),
+    "ollama": _gate("ollama", settings.admission_ollama_limit),
+}
+
+
+def gate(backend: str) -> Gate:
+    return gates[backend]
+
+
+def _gate_metrics() -> list:
+    stats = {name: g.stats() for name, g in gates.items()}
+    return [
+        (
+            "ragai_admission_queue_depth",
+            "Requests waiting for a generation slot.",
+            "gauge",
+            [
+                ({"backend": name, "priority": p}, s["queued"][p])
+                for name, s in stats.items()
+                for p in PRIORITY_NAMES
+            ],
+        ),
+        (
+            "ragai_admission_in_flight",
+            "Generation slots in use.",
+            "gauge",
+            [({"backend": name}, s["in_flight"]) for name, s in stats.items()],
+        ),
+        (
+            "ragai_admission_limit",
+            "Generation slots per backend (0: unlimited).",
+            "gauge",
+            [({"backend": name}, s["limit"]) for name, s in stats.items()],
+        ),
+    ]
+
+
+metrics.register_collector(_gate_metrics)
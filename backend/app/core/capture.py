@@ -0,0 +1,171 @@
+"""Opt-in capture of slow and sampled queries, for reproducing them later.
+
+With ``CAPTURE_ENABLED`` each ``agent.runner`` and ``offline.rag`` query
+collects a small trace with these fields:
+
+  * the question;
+  * the session history length;
+  * retrieved passages with scores;
+  * tool calls;
+  * per-stage timings (``retrieve``, ``embed``, ``ttft``, ``total`` …);
+  * token counts.
+
+A trace is written when the query took at least ``CAPTURE_SLOW_MS`` or falls
+in the ``CAPTURE_SAMPLE_RATE`` random sample. It is one JSON line in
+``CAPTURE_PATH``, rotated at ``CAPTURE_MAX_BYTES`` with ``CAPTURE_BACKUPS``
+old files kept. Lines go through a queue to a background thread, so the
+request path never waits on the disk. ``python -m bench.replay`` re-runs
+captured traffic against the current build.
+
+Records contain user questions and passages from their documents, so treat
+the files as sensitive as the documents themselves. User ids are hashed.
+
+Code that runs inside a query (e.g. an agent tool) reaches the active trace
+through ``current()``; everything is a no-op when capture is disabled.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import threading
+import time
+
+from app.settings import settings
+
+_current: contextvars.ContextVar["Trace | None"] = contextvars.ContextVar(
+    "capture_trace", default=None
+)
+_logger: logging.Logger | None = None
+_listener: logging.handlers.QueueListener | None = None
+_lock = threading.Lock()
+
+
+def _writer() -> logging.Logger:
+    global _logger, _listener
+    if _logger is None:
+        with _lock:
+            if _logger is None:
+                os.makedirs(os.path.dirname(settings.capture_path) or ".", exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    settings.capture_path,
+                    maxBytes=settings.capture_max_bytes,
+                    backupCount=settings.capture_backups,
+                    encoding="utf-8",
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                lines: queue.SimpleQueue = queue.SimpleQueue()
+                _listener = logging.handlers.QueueListener(lines, handler)
+                _listener.start()
+                logger = logging.getLogger("ragai.capture")
+                logger.propagate = False
+                logger.setLevel(logging.INFO)
+                logger.addHandler(logging.handlers.QueueHandler(lines))
+                _logger = logger
+    return _logger
+
+
+def close() -> None:
+    """Flush queued records to disk and stop the writer thread."""
+    global _logger, _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+        if _logger is not None:
+            for handler in list(_logger.handlers):
+                _logger.removeHandler(handler)
+        _logger = _listener = None
+
+
+def _clip(text: str) -> str:
+    limit = settings.capture_max_chars
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+class Trace:
+    """Everything recorded about one query; written by ``finish`` if sampled."""
+
+    def __init__(self, backend: str, mode: str, query: str, **fields) -> None:
+        self._start = time.perf_counter()
+        self._done = False
+        user = fields.pop("user", None)
+        self.record: dict = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "backend": backend,
+            "mode": mode,
+            "query": _clip(query),
+            "user": hashlib.sha256(user.encode()).hexdigest()[:16] if user else None,
+            "history": 0,
+            "retrieval": [],
+            "tool_calls": [],
+            "stages": {},
+            "tokens": {},
+            **fields,
+        }
+
+    def note(self, **fields) -> None:
+        self.record.update(fields)
+
+    def stage(self, name: str, seconds: float) -> None:
+        stages = self.record["stages"]
+        key = f"{name}_ms"
+        stages[key] = round(stages.get(key, 0.0) + seconds * 1000, 2)
+
+    def since_start(self) -> float:
+        return time.perf_counter() - self._start
+
+    def retrieval(self, contexts: list[dict]) -> None:
+        self.record["retrieval"].extend(
+            {
+                "source": c.get("source"),
+                "score": c.get("score", c.get("distance")),
+                "text": _clip(c.get("text", "")),
+            }
+            for c in contexts
+        )
+
+    def tool_call(self, name: str, args: dict | None = None) -> None:
+        self.record["tool_calls"].append({"name": name, "args": args or {}})
+
+    def tokens(self, **counts: int | None) -> None:
+        tokens = self.record["tokens"]
+        for kind, n in counts.items():
+            if n:
+                tokens[kind] = tokens.get(kind, 0) + n
+
+    def fail(self, exc: BaseException) -> None:
+        self.record["error"] = type(exc).__name__
+        self.finish()
+
+    def finish(self, answer: str | None = None) -> None:
+        if self._done:
+            return
+        self._done = True
+        total_ms = self.since_start() * 1000
+        self.record["stages"]["total_ms"] = round(total_ms, 2)
+        if answer is not None:
+            self.record["answer"] = _clip(answer)
+        slow = settings.capture_slow_ms > 0 and total_ms >= settings.capture_slow_ms
+        if slow or random.random() < settings.capture_sample_rate:
+            self.record["slow"] = slow
+            _writer().info(json.dumps(self.record, ensure_ascii=False, default=str))
+
+
+def start(backend: str, mode: str, query: str, **fields) -> Trace | None:
+    """Begin a trace for this query (``None`` when capture is disabled)."""
+    if not settings.capture_enabled:
+        return None
+    trace = Trace(backend, mode, query, **fields)
+    # Tasks started from here on (e.g. ADK tool calls) inherit the trace.
+    _current.set(trace)
+    return trace
+
+
+def current() -> Trace | None:
+    return _current.get()
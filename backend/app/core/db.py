@@ -0,0 +1,101 @@
+"""Async MongoDB data access for the online stack.
+
+One ``AsyncMongoClient`` (pool sized by ``MONGO_MAX_POOL_SIZE`` /
+``MONGO_MIN_POOL_SIZE``) is shared by users, shared corpora and agent
+sessions. ``ensure_indexes`` runs right after startup so username lookups hit a unique
+index and signup can rely on it instead of a check-then-insert. Hot paths
+read with the projections below so the password hash is only fetched at
+signin.
+
+The client (and ``pymongo`` itself) is created on first use, so importing
+this module costs nothing in an offline-only deployment.
+
+Tests (or a local run) can point the layer at a local ``mongod`` through
+``MONGO_URI``, or hand any API-compatible async client to ``use_client``.
+"""
+
+import logging
+
+from fastapi import HTTPException
+
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+DB_NAME = "ragai"
+
+# Field projections for hot paths.
+CORPUS_ONLY = {"_id": 0, "corpus": 1}
+CORPUS_STATE = {"_id": 0, "corpus": 1, "corpus_status": 1}
+CREDENTIALS = {"_id": 0, "username": 1, "password": 1, "corpus": 1, "corpus_status": 1}
+EXISTS = {"_id": 1}
+
+# pymongo.ASCENDING, without importing pymongo.
+ASCENDING = 1
+
+_client = None
+_connected = False
+
+
+def _connect() -> None:
+    global _client, _connected
+    _connected = True
+    if not settings.mongo_uri:
+        return
+    try:
+        from pymongo import AsyncMongoClient
+
+        _client = AsyncMongoClient(
+            settings.mongo_uri,
+            maxPoolSize=settings.mongo_max_pool_size,
+            minPoolSize=settings.mongo_min_pool_size,
+            serverSelectionTimeoutMS=settings.mongo_timeout_ms,
+        )
+    except Exception:  # pragma: no cover
+        logger.exception("Failed to configure MongoDB; online auth disabled")
+        _client = None
+
+
+def use_client(client) -> None:
+    """Point the data layer at ``client`` (e.g. a local mongod in tests)."""
+    global _client, _connected
+    _client, _connected = client, True
+
+
+def _get_client():
+    if not _connected:
+        _connect()
+    return _client
+
+
+def configured() -> bool:
+    return _get_client() is not None
+
+
+def database():
+    if _get_client() is None:
+        raise HTTPException(status_code=503, detail="Online mode is not configured")
+    return _client[DB_NAME]
+
+
+def users():
+    return database()["users"]
+
+
+def shared_corpora():
+    return database()["shared_corpora"]
+
+
+async def ensure_indexes() -> None:
+    """Create the indexes the auth and corpus paths rely on (idempotent)."""
+    if _get_client() is None:
+        return
+    await users().create_index([("username", ASCENDING)], unique=True)
+    await shared_corpora().create_index([("name", ASCENDING)], unique=True)
+    await shared_corpora().create_index([("members", ASCENDING)])
+    await database()["corpus_pool"].create_index([("created_at", ASCENDING)])
+
+
+async def close() -> None:
+    if _client is not None:
+        await _client.close()
@@ -0,0 +1,185 @@
+"""In-process latency and cache metrics, exposed in Prometheus text format.
+
+Deliberately dependency-free and cheap: an observation is a bisect plus a
+couple of increments under a lock, so instrumenting hot paths costs well
+under a microsecond. Values are per process; with several uvicorn workers
+each one serves its own ``/metrics`` (scrape them per worker or per pod).
+
+Pipeline stages share one histogram, labelled by ``stage`` and ``backend``:
+
+  ====================  =====================================================
+  stage                 measured around
+  ====================  =====================================================
+  ``embed``             Ollama embedding calls
+  ``retrieve``          Chroma / Vertex RAG retrieval
+  ``ttft``              request start -> first generated token
+  ``generate``          full LLM generation (offline)
+  ``tool``              agent tool calls (``backend`` is the tool name)
+  ``mongo``             user / corpus lookups on a cache miss
+  ``store``             Chroma writes
+  ``ingest``            one offline document, extract -> store
+  ``total``             a whole query, end to end
+  ====================  =====================================================
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+# Seconds; spans sub-millisecond cache hits up to slow LLM answers.
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+_registry: list = []
+# Callables returning [(name, help, type, [(labels, value), ...]), ...],
+# for values that already live elsewhere (e.g. pool statistics).
+_collectors: list[Callable[[], list]] = []
+
+
+def _fmt_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _HistogramChild:
+    __slots__ = ("_buckets", "_counts", "_sum", "_lock")
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name, self.help, self.labelnames, self.buckets = name, help, labelnames, buckets
+        self._children: dict[tuple[str, ...], _HistogramChild] = {}
+        _registry.append(self)
+
+    def labels(self, *values: str) -> _HistogramChild:
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, _HistogramChild(self.buckets))
+        return child
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child._counts), child._sum
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _fmt_labels(self.labelnames, values, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += counts[-1]
+            labels = _fmt_labels(self.labelnames, values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _fmt_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._children: dict[tuple[str, ...], _CounterChild] = {}
+        _registry.append(self)
+
+    def labels(self, *values: str) -> _CounterChild:
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, _CounterChild())
+        return child
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, child in list(self._children.items()):
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, values)} {child.value}")
+        return lines
+
+
+def register_collector(collect: Callable[[], list]) -> None:
+    _collectors.append(collect)
+
+
+def render() -> str:
+    """Return every metric in the Prometheus text exposition format."""
+    lines: list[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        for name, help, kind, samples in collect():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                names, values = tuple(labels), tuple(labels.values())
+                lines.append(f"{name}{_fmt_labels(names, values)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Shared metrics ----------------------------------------------------------
+
+STAGE_SECONDS = Histogram(
+    "ragai_stage_seconds", "Latency of each RAG pipeline stage.", ("stage", "backend")
+)
+CACHE_REQUESTS = Counter(
+    "ragai_cache_requests_total", "Cache lookups by cache and result.", ("cache", "result")
+)
+INGEST_DOCUMENTS = Counter("ragai_ingest_documents_total", "Offline documents ingested.")
+INGEST_PAGES = Counter("ragai_ingest_pages_total", "Offline document pages ingested.")
+INGEST_CHUNKS = Counter("ragai_ingest_chunks_total", "Offline chunks embedded and stored.")
+
+
+def stage(name: str, backend: str) -> _HistogramChild:
+    """Shorthand: ``with metrics.stage("retrieve", "chroma").time(): ...``."""
+    return STAGE_SECONDS.labels(name, backend)
+
+
+def cache(name: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(name, "hit" if hit else "miss").inc()
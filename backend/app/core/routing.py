@@ -0,0 +1,170 @@
+"""Query-complexity routing between a fast and a strong model tier.
+
+Most questions against a document set are lookups ("what is the notice
+period?") that a small model answers as well as a large one, in a fraction
+of the time. ``decide`` looks at cheap signals that are available before
+generation starts. A question goes to the ``fast`` tier only when all of
+them agree it is simple:
+
+  * ``long_query``: the question is longer than ``ROUTE_MAX_QUERY_CHARS``;
+  * ``complex``: it asks for analysis (compare, explain why, summarise …);
+  * ``deep_history``: the session has more than ``ROUTE_MAX_HISTORY`` prior
+    user and model messages (tool calls don't count), so the answer likely
+    depends on earlier turns;
+  * ``weak_retrieval``: no passage was found, or the closest one is farther
+    than the backend's limit: ``ROUTE_MAX_DISTANCE_VERTEX`` (cosine distance)
+    or ``ROUTE_MAX_DISTANCE_CHROMA`` (squared L2). This is checked only where
+    passages exist before generation: offline, and the online fast path (the
+    tool-calling agent retrieves mid-turn).
+
+Any signal that fires becomes a reason, and the question goes to the
+``strong`` tier. With ``ROUTE_ESCALATE`` a fast answer that opens like a
+non-answer ("I couldn't find …", see ``low_confidence``) is thrown away and
+regenerated by the strong tier. Streams hold back the first
+``ROUTE_PROBE_CHARS`` of a fast answer so the check happens before the user
+sees anything.
+
+Routing is off for a backend until its fast model is configured
+(``FAST_MODEL_ID`` / ``OLLAMA_FAST_LLM_MODEL``). Decisions and per-tier
+latency are exported as ``ragai_route_decisions_total`` and
+``ragai_route_seconds``, and noted on the capture trace.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+
+from app.core import metrics
+from app.settings import settings
+
+FAST, STRONG = "fast", "strong"
+
+DECISIONS = metrics.Counter(
+    "ragai_route_decisions_total",
+    "Model tier chosen per query, with the deciding reason.",
+    ("backend", "tier", "reason"),
+)
+ESCALATIONS = metrics.Counter(
+    "ragai_route_escalations_total",
+    "Fast-tier answers discarded as low confidence and regenerated.",
+    ("backend",),
+)
+TIER_SECONDS = metrics.Histogram(
+    "ragai_route_seconds",
+    "Generation time by final tier, including any discarded fast attempt "
+    "(outcome=escalated: that attempt alone).",
+    ("backend", "tier", "outcome"),
+)
+
+_COMPLEX = re.compile(
+    r"\b(compare|comparison|contrast|difference|differences|versus|vs\.?|why|explain|"
+    r"analy[sz]e|analysis|summari[sz]e|summary|pros and cons|trade-?offs?|evaluate|"
+    r"step[- ]by[- ]step|in detail|implications?)\b",
+    re.IGNORECASE,
+)
+_NON_ANSWER = re.compile(
+    r"\b(i (do not|don't|cannot|can't|could not|couldn't) (know|find|answer|determine|tell)|"
+    r"i'?m not sure|not (enough|sufficient) information|insufficient|"
+    r"no (relevant )?information|(is|are) not (mentioned|provided|covered|included)|"
+    r"(do|does) not (mention|contain|provide)|(don't|doesn't) (mention|contain|provide)|"
+    r"unable to (find|answer|determine))\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class Decision:
+    tier: str
+    model: str
+    reasons: list[str] = field(default_factory=list)
+    escalated: bool = False
+
+    def record(self, backend: str) -> None:
+        reason = self.reasons[0] if self.reasons else "simple"
+        DECISIONS.labels(backend, self.tier, reason).inc()
+
+
+def fast_model(backend: str) -> str | None:
+    return settings.fast_model_id if backend == "adk" else settings.ollama_fast_llm_model
+
+
+def strong_model(backend: str) -> str:
+    return settings.model_id if backend == "adk" else settings.ollama_llm_model
+
+
+def max_distance(backend: str) -> float:
+    """Closest-passage cut-off, in the units of the backend's vector store."""
+    if backend == "adk":
+        return settings.route_max_distance_vertex
+    return settings.route_max_distance_chroma
+
+
+def enabled(backend: str) -> bool:
+    fast = fast_model(backend)
+    return bool(fast) and fast != strong_model(backend)
+
+
+def _best_distance(contexts: list[dict]) -> float | None:
+    scores = [
+        c.get("score", c.get("distance"))
+        for c in contexts
+        if c.get("score", c.get("distance")) is not None
+    ]
+    return min(scores) if scores else None
+
+
+def decide(
+    backend: str, text: str, history: int, contexts: list[dict] | None = None
+) -> Decision:
+    """Pick a tier from cheap pre-generation signals (``contexts=None``: unknown)."""
+    if not enabled(backend):
+        return Decision(STRONG, strong_model(backend))
+
+    reasons = []
+    if len(text) > settings.route_max_query_chars:
+        reasons.append("long_query")
+    if _COMPLEX.search(text):
+        reasons.append("complex")
+    if history > settings.route_max_history:
+        reasons.append("deep_history")
+    if contexts is not None:
+        best = _best_distance(contexts)
+        if best is None or best > max_distance(backend):
+            reasons.append("weak_retrieval")
+
+    if reasons:
+        decision = Decision(STRONG, strong_model(backend), reasons)
+    else:
+        decision = Decision(FAST, fast_model(backend))
+    decision.record(backend)
+    return decision
+
+
+def low_confidence(answer: str) -> bool:
+    """Does the opening of a fast-tier answer look like a non-answer?"""
+    head = answer[: max(settings.route_probe_chars, 1)].strip()
+    return not head or bool(_NON_ANSWER.search(head))
+
+
+def should_escalate(decision: Decision, answer: str) -> bool:
+    return decision.tier == FAST and settings.route_escalate and low_confidence(answer)
+
+
+def escalate(backend: str, decision: Decision, fast_seconds: float) -> Decision:
+    """Record the discarded fast attempt and return the strong-tier decision."""
+    ESCALATIONS.labels(backend).inc()
+    TIER_SECONDS.labels(backend, FAST, "escalated").observe(fast_seconds)
+    return Decision(
+        STRONG, strong_model(backend), [*decision.reasons, "low_confidence"], escalated=True
+    )
+
+
+def observe(backend: str, decision: Decision, seconds: float) -> None:
+    TIER_SECONDS.labels(backend, decision.tier, "answered").observe(seconds)
+
+
+def note(trace, decision: Decision) -> None:
+    """Put the routing outcome on a capture trace (if any)."""
+    if trace is not None:
+        trace.note(route=decision.tier, route_reasons=decision.reasons, escalated=decision.escalated)
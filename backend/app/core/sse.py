@@ -0,0 +1,129 @@
+"""Shared Server-Sent Events encoder for the online and offline streams.
+
+Streaming generators (``agent.runner.stream_query``, ``offline.rag.stream_query``)
+yield plain ``str`` tokens followed by one ``dict``: the ``done`` payload.
+``event_stream`` turns that into the wire format the frontend expects:
+
+    data: {"token": "..."}            (zero or more)
+    event: done
+    data: {"citations": [...], "session_id": "..."}
+
+Tokens are coalesced into one frame per ``SSE_COALESCE_MS`` window or
+``SSE_COALESCE_CHARS``, whichever comes first, so fast local models don't
+cost a write per token. A ``: ping`` comment is sent whenever the source is
+quiet for ``SSE_HEARTBEAT_SECONDS`` (e.g. during a long tool call) to keep
+proxies from closing the connection.
+
+The source is drained by a separate task into a bounded queue. When the
+client reads slowly the queue fills and generation pauses (backpressure).
+When the client disconnects, Starlette cancels the response, and that
+cancellation is passed on to the source so upstream generation stops too.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import AsyncIterable, AsyncIterator, Iterable
+
+from starlette.concurrency import iterate_in_threadpool
+
+from app.settings import settings
+
+try:  # orjson is optional; it is several times faster for these small payloads.
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+
+except ImportError:  # pragma: no cover - depends on installed extras
+    import json
+
+    def _dumps(obj) -> str:
+        return json.dumps(obj, separators=(",", ":"))
+
+HEARTBEAT = b": ping\n\n"
+_END = object()
+
+
+class _Failed:
+    def __init__(self, exc: BaseException) -> None:
+        self.exc = exc
+
+
+def frame(data: dict, event: str | None = None) -> bytes:
+    """Encode one SSE frame."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {_dumps(data)}\n\n".encode()
+
+
+async def _produce(source: AsyncIterable | Iterable, queue: asyncio.Queue) -> None:
+    items = source if hasattr(source, "__aiter__") else iterate_in_threadpool(iter(source))
+    try:
+        async for item in items:
+            await queue.put(item)
+    except Exception as exc:  # noqa: BLE001 - re-raised by the consumer
+        await queue.put(_Failed(exc))
+        return
+    finally:
+        aclose = getattr(items, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    await queue.put(_END)
+
+
+async def event_stream(source: AsyncIterable | Iterable) -> AsyncIterator[bytes]:
+    """Encode a token/done ``source`` as coalesced SSE frames with heartbeats."""
+    loop = asyncio.get_running_loop()
+    window = settings.sse_coalesce_ms / 1000
+    max_chars = settings.sse_coalesce_chars
+    heartbeat = settings.sse_heartbeat_seconds
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=settings.sse_queue_size)
+    producer = asyncio.create_task(_produce(source, queue))
+
+    buffer: list[str] = []
+    buffered = 0
+    deadline = 0.0
+    try:
+        while True:
+            timeout = max(deadline - loop.time(), 0) if buffer else heartbeat
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                if buffer:
+                    yield frame({"token": "".join(buffer)})
+                    buffer.clear()
+                    buffered = 0
+                else:
+                    yield HEARTBEAT
+                continue
+
+            if isinstance(item, str):
+                if not buffer:
+                    deadline = loop.time() + window
+                buffer.append(item)
+                buffered += len(item)
+                if buffered >= max_chars:
+                    yield frame({"token": "".join(buffer)})
+                    buffer.clear()
+                    buffered = 0
+                continue
+
+            # Anything else ends the token run: flush what we have first.
+            if buffer:
+                yield frame({"token": "".join(buffer)})
+                buffer.clear()
+                buffered = 0
+            if item is _END:
+                return
+            if isinstance(item, _Failed):
+                raise item.exc
+            yield frame(item, event="done")
+    finally:
+        # Client gone (Starlette cancelled us) or stream finished: stop the
+        # upstream generator rather than letting it run to completion.
+        producer.cancel()
+        try:
+            await producer
+        except (asyncio.CancelledError, Exception):  # noqa: BLE001
+            pass
@@ -1,13 +1,26 @@
-"""RagAI backend application entrypoint."""
+"""RagAI backend application entrypoint.
 
+Startup is mode-aware. The online routers, and MongoDB/bcrypt behind them, are
+only imported when online mode is configured. The heavy online SDKs (Vertex
+AI, Gemini, ADK) are loaded by a background warm-up after the server is
+already answering ``/health`` (or on first use with ``STARTUP_WARMUP=false``).
+``python -m bench.startup`` reports per-module import time and time to first
+``/health``.
+"""
+
+import asyncio
 import logging
+import sys
+import time
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 import app.config as config
 from app.settings import settings
-from app.api import auth, files, rag
+from app.core import capture, db, metrics
 
 logging.basicConfig(
     level=logging.INFO,
@@ -29,9 +42,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(auth.router, prefix="/auth", tags=["auth"])
-app.include_router(files.router, prefix="/file", tags=["files"])
-app.include_router(rag.router, prefix="/rag", tags=["rag"])
+_ONLINE_PREFIXES = ("/auth", "/file", "/rag", "/shared")
+
+if settings.online_enabled:
+    from app.api import auth, files, rag, shared
+
+    app.include_router(auth.router, prefix="/auth", tags=["auth"])
+    app.include_router(files.router, prefix="/file", tags=["files"])
+    app.include_router(rag.router, prefix="/rag", tags=["rag"])
+    app.include_router(shared.router, prefix="/shared", tags=["shared"])
+else:
+
+    async def _online_disabled() -> None:
+        raise HTTPException(status_code=503, detail="Online mode is not configured")
+
+    for _prefix in _ONLINE_PREFIXES:
+        app.add_api_route(
+            f"{_prefix}/{{path:path}}",
+            _online_disabled,
+            methods=["GET", "POST", "PUT", "PATCH", "DELETE"],
+            include_in_schema=False,
+        )
 
 
 @app.get("/", tags=["meta"])
@@ -42,23 +73,82 @@ def root() -> dict:
 @app.get("/health", tags=["meta"])
 def health() -> dict:
     """Liveness/readiness probe used by Docker, load balancers and orchestration."""
-    online_ready = config.client is not None and config.users is not None
+    # Cheap by design: never triggers loading the online stack. Readiness
+    # turns true once the background warm-up (or first request) has run.
+    online_ready = config.client_state() == "ready" and db.configured()
     return {
         "status": "ok",
         "online": {
             "configured": settings.cloud_enabled,
             "ready": online_ready,
+            "state": config.client_state(),
+            "agent_pool": _agent_pool_stats(),
         },
     }
 
 
+def _agent_pool_stats() -> dict | None:
+    runner = sys.modules.get("app.agent.runner")
+    return runner.runner_pool.stats() if runner is not None else None
+
+
+@app.get("/metrics", tags=["meta"], response_class=PlainTextResponse)
+def prometheus_metrics() -> PlainTextResponse:
+    """Per-stage latency histograms and cache counters (Prometheus text format)."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+_warmup: asyncio.Task | None = None
+
+
+def _load_online_stack() -> None:
+    """Import and initialise Vertex AI, Gemini and the ADK agent stack."""
+    config.get_client()
+    config.get_session_service()
+    from app.agent import runner  # noqa: F401 - google.adk, agent pool
+
+
+async def _warm_up() -> None:
+    try:
+        await db.ensure_indexes()
+    except Exception:  # noqa: BLE001 - Mongo may be briefly unreachable at boot
+        logger.exception("Failed to create MongoDB indexes")
+
+    from app.services import corpus_pool
+
+    corpus_pool.start()
+    if settings.startup_warmup and settings.cloud_enabled:
+        start = time.perf_counter()
+        await run_in_threadpool(_load_online_stack)
+        logger.info("Online stack loaded in %.0f ms", (time.perf_counter() - start) * 1000)
+
+
 @app.on_event("startup")
-def _startup() -> None:
+async def _startup() -> None:
+    global _warmup
     logger.info(
         "RagAI starting — online=%s (project=%s, location=%s)",
-        config.client is not None,
+        settings.online_enabled,
         settings.project_id,
         settings.location,
     )
     if settings.jwt_secret == "change-me-in-production":
         logger.warning("JWT_SECRET is the default value — set a strong secret in production!")
+    # Index creation and SDK loading happen off the startup path so the
+    # server starts answering /health immediately.
+    if settings.online_enabled:
+        _warmup = asyncio.create_task(_warm_up())
+
+
+@app.on_event("shutdown")
+async def _shutdown() -> None:
+    if _warmup is not None:
+        _warmup.cancel()
+    if settings.online_enabled:
+        from app.services import corpus_pool
+
+        await corpus_pool.stop()
+    # Persist any write-behind session events before the worker exits.
+    await config.flush_sessions()
+    await db.close()
+    capture.close()
@@ -1,5 +1,5 @@
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class UserSignup(BaseModel):
     username: str
@@ -14,4 +14,22 @@ class DeleteFileRequest(BaseModel):
 
 class TextRequest(BaseModel):
     text: str
-    session_id: Optional[str] = None
\ No newline at end of file
+    session_id: Optional[str] = None
+    # Retrieve-first fast path; None uses the AGENT_FAST_MODE default.
+    fast: Optional[bool] = None
+    # Background/bulk callers set this so interactive users are served first
+    # when the model is saturated.
+    batch: bool = False
+
+class BatchRetrieveRequest(BaseModel):
+    queries: list[str] = Field(min_length=1, max_length=1000)
+    # Stream NDJSON results as they complete instead of one ordered response.
+    stream: bool = False
+
+
+class SharedCorpusCreate(BaseModel):
+    name: str = Field(min_length=1, max_length=64, pattern=r"^[A-Za-z0-9_-]+$")
+
+
+class SharedCorpusGrant(BaseModel):
+    username: str
@@ -9,9 +9,11 @@ from __future__ import annotations
 
 import io
 import logging
+import time
 
 from pypdf import PdfReader
 
+from app.core import metrics
 from app.settings import settings
 from app.offline import llm, store
 
@@ -50,6 +52,7 @@ def _ocr_pdf(data: bytes) -> str:
 
 def _extract_pdf(data: bytes) -> str:
     reader = PdfReader(io.BytesIO(data))
+    metrics.INGEST_PAGES.inc(len(reader.pages))
     text = "\n".join((page.extract_text() or "") for page in reader.pages).strip()
     # Sparse text usually means a scanned PDF -> fall back to OCR.
     if len(text) < 100:
@@ -61,6 +64,8 @@ def _extract_pdf(data: bytes) -> str:
 
 def extract_text(filename: str, data: bytes) -> str:
     ext = _ext(filename)
+    if ext != "pdf":
+        metrics.INGEST_PAGES.inc()
     if ext in _TEXT_EXT:
         return data.decode("utf-8", errors="ignore")
     if ext == "pdf":
@@ -82,9 +87,14 @@ def chunk_text(text: str) -> list[str]:
 
 def ingest(filename: str, data: bytes) -> int:
     """Extract, chunk, embed and store a document. Returns chunks stored."""
+    start = time.perf_counter()
     text = extract_text(filename, data)
     chunks = chunk_text(text)
     if not chunks:
         raise ValueError("No extractable text found in the document")
     embeddings = llm.embed(chunks)
-    return store.add_chunks(filename, chunks, embeddings)
+    stored = store.add_chunks(filename, chunks, embeddings)
+    metrics.stage("ingest", "offline").observe(time.perf_counter() - start)
+    metrics.INGEST_DOCUMENTS.inc()
+    metrics.INGEST_CHUNKS.inc(stored)
+    return stored
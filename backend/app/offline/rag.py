@@ -1,16 +1,28 @@
 """Offline RAG orchestration: retrieve from ChromaDB, generate with Ollama.
 
 Mirrors the online contract in ``agent/runner.py``: ``run_query`` returns
-``{answer, citations, session_id}`` and ``stream_query`` yields the same SSE
-shape (``data: {"token": ...}`` then ``event: done`` with citations + session).
+``{answer, citations, session_id}`` and ``stream_query`` yields tokens then a
+``{citations, session_id}`` payload, which ``app.core.sse.event_stream``
+encodes as the same SSE shape (``data: {"token": ...}`` then ``event: done``).
 Conversation history is held in-memory per ``session_id`` for multi-turn parity.
+
+Generation runs under the ``ollama`` admission gate (``app.core.admission``):
+one local model serves only a few generations well at a time, so callers
+beyond that queue fairly per ``user`` (default: the session) or get
+``admission.Rejected`` (a 429) once the wait would be too long.
+
+Before generation, ``app.core.routing`` picks the fast or strong Ollama model
+from the question, history depth and retrieval distance; a fast answer that
+opens like a non-answer is regenerated with the strong model.
 """
 
 from __future__ import annotations
 
-import json
+import itertools
+import time
 import uuid
 
+from app.core import admission, capture, metrics, routing
 from app.settings import settings
 from app.offline import llm, store
 
@@ -25,9 +37,60 @@ _SYSTEM_PROMPT = (
 )
 
 
-def _retrieve(text: str) -> list[dict]:
+def _retrieve(text: str, trace: capture.Trace | None = None) -> list[dict]:
+    if trace is None:
+        return store.query(llm.embed_one(text), settings.retrieval_top_k)
+
+    start = time.perf_counter()
     embedding = llm.embed_one(text)
-    return store.query(embedding, settings.retrieval_top_k)
+    embedded = time.perf_counter()
+    contexts = store.query(embedding, settings.retrieval_top_k)
+    trace.stage("embed", embedded - start)
+    trace.stage("retrieve", time.perf_counter() - embedded)
+    trace.retrieval(contexts)
+    return contexts
+
+
+def _start_trace(mode: str, session_id: str, text: str) -> capture.Trace | None:
+    trace = capture.start("ollama", mode, text)
+    if trace is not None:
+        trace.note(history=len(_sessions.get(session_id, [])))
+    return trace
+
+
+def _finish_trace(trace: capture.Trace, messages: list[dict], answer: str, tokens: int) -> None:
+    # Ollama streams roughly one token per chunk; the prompt size is recorded
+    # in characters since the stream doesn't report prompt token counts.
+    trace.note(prompt_chars=sum(len(m["content"]) for m in messages))
+    trace.tokens(output=tokens)
+    trace.finish(answer)
+
+
+def _route(session_id: str, text: str, contexts: list[dict]) -> routing.Decision:
+    return routing.decide("ollama", text, len(_sessions.get(session_id, [])), contexts)
+
+
+def _generate(messages: list[dict], decision: routing.Decision):
+    """Return (token iterator, decision), escalating a weak fast-tier opening.
+
+    A fast-tier stream is read ahead up to ``ROUTE_PROBE_CHARS`` and checked
+    before anything is handed on, so a discarded attempt is never seen.
+    """
+    tokens = llm.chat_stream(messages, decision.model)
+    if decision.tier != routing.FAST or not settings.route_escalate:
+        return tokens, decision
+    start = time.perf_counter()
+    held, size = [], 0
+    for token in tokens:
+        held.append(token)
+        size += len(token)
+        if size >= settings.route_probe_chars:
+            break
+    if not routing.low_confidence("".join(held)):
+        return itertools.chain(held, tokens), decision
+    tokens.close()
+    decision = routing.escalate("ollama", decision, time.perf_counter() - start)
+    return llm.chat_stream(messages, decision.model), decision
 
 
 def _build_messages(session_id: str, text: str, contexts: list[dict]) -> list[dict]:
@@ -63,27 +126,91 @@ def _remember(session_id: str, user_text: str, answer: str) -> None:
     del history[:-_MAX_HISTORY]  # keep only the most recent turns
 
 
-def run_query(session_id: str | None, text: str) -> dict:
+def run_query(
+    session_id: str | None,
+    text: str,
+    user: str | None = None,
+    priority: int = admission.STANDARD,
+) -> dict:
     """Non-streaming offline answer."""
+    start = time.perf_counter()
     session_id = session_id or uuid.uuid4().hex
-    contexts = _retrieve(text)
-    messages = _build_messages(session_id, text, contexts)
-    answer = "".join(llm.chat_stream(messages))
+    trace = _start_trace("query", session_id, text)
+    try:
+        contexts = _retrieve(text, trace)
+        decision = _route(session_id, text, contexts)
+        messages = _build_messages(session_id, text, contexts)
+        with admission.gate("ollama").enter(user or session_id, priority):
+            generating = time.perf_counter()
+            stream, decision = _generate(messages, decision)
+            tokens = list(stream)
+        routing.observe("ollama", decision, time.perf_counter() - generating)
+    except BaseException as exc:
+        if trace is not None:
+            trace.fail(exc)
+        raise
+    answer = "".join(tokens)
     _remember(session_id, text, answer)
+    metrics.stage("total", "offline").observe(time.perf_counter() - start)
+    if trace is not None:
+        routing.note(trace, decision)
+        _finish_trace(trace, messages, answer, len(tokens))
     return {"answer": answer, "citations": _citations(contexts), "session_id": session_id}
 
 
-def stream_query(session_id: str | None, text: str):
-    """Async-iterable-compatible generator yielding SSE lines (sync generator)."""
-    session_id = session_id or uuid.uuid4().hex
-    contexts = _retrieve(text)
-    messages = _build_messages(session_id, text, contexts)
+def stream_query(
+    session_id: str | None,
+    text: str,
+    user: str | None = None,
+    priority: int = admission.INTERACTIVE,
+):
+    """Return a sync generator yielding tokens, then the done payload.
 
-    parts: list[str] = []
-    for token in llm.chat_stream(messages):
-        parts.append(token)
-        yield f"data: {json.dumps({'token': token})}\n\n"
+    Retrieval and admission happen before this returns, so an overloaded
+    model raises ``admission.Rejected`` (a 429) here rather than after the
+    response has started; both block, so call it from a worker thread. Wrap
+    the result in ``app.core.sse.event_stream``, which drives it from a worker
+    thread so Ollama calls stay off the event loop.
+    """
+    stream = _stream(session_id, text, user, priority)
+    next(stream)  # runs up to the held slot, or raises
+    return stream
 
-    _remember(session_id, text, "".join(parts))
-    payload = {"citations": _citations(contexts), "session_id": session_id}
-    yield f"event: done\ndata: {json.dumps(payload)}\n\n"
+
+def _stream(session_id: str | None, text: str, user: str | None, priority: int):
+    start = time.perf_counter()
+    session_id = session_id or uuid.uuid4().hex
+    trace = _start_trace("stream", session_id, text)
+    try:
+        contexts = _retrieve(text, trace)
+        decision = _route(session_id, text, contexts)
+        messages = _build_messages(session_id, text, contexts)
+
+        parts: list[str] = []
+        with admission.gate("ollama").enter(user or session_id, priority):
+            # Paused here by stream_query; once started, closing or dropping
+            # the generator releases the slot even if it is never read.
+            yield
+            generating = time.perf_counter()
+            stream, decision = _generate(messages, decision)
+            for token in stream:
+                if not parts:
+                    ttft = time.perf_counter() - start
+                    metrics.stage("ttft", "offline").observe(ttft)
+                    if trace is not None:
+                        trace.stage("ttft", ttft)
+                parts.append(token)
+                yield token
+        routing.observe("ollama", decision, time.perf_counter() - generating)
+    except BaseException as exc:
+        if trace is not None:
+            trace.fail(exc)
+        raise
+
+    answer = "".join(parts)
+    _remember(session_id, text, answer)
+    metrics.stage("total", "offline").observe(time.perf_counter() - start)
+    if trace is not None:
+        routing.note(trace, decision)
+        _finish_trace(trace, messages, answer, len(parts))
+    yield {"citations": _citations(contexts), "session_id": session_id}
@@ -1,7 +1,8 @@
 """Persistent local vector store (ChromaDB) for offline documents.
 
 Embeddings are computed externally (Ollama) and supplied explicitly, so the
-collection uses no built-in embedding function.
+collection uses no built-in embedding function. ``chromadb`` is imported and
+the store opened on first use, not at import.
 """
 
 from __future__ import annotations
@@ -9,18 +10,23 @@ from __future__ import annotations
 import logging
 import os
 import uuid
+from functools import lru_cache
 
-import chromadb
-
+from app.core import metrics
 from app.settings import settings
 
 logger = logging.getLogger(__name__)
 
 _COLLECTION = "offline_docs"
 
-os.makedirs(settings.chroma_path, exist_ok=True)
-_client = chromadb.PersistentClient(path=settings.chroma_path)
-_collection = _client.get_or_create_collection(name=_COLLECTION)
+
+@lru_cache(maxsize=1)
+def _collection():
+    import chromadb
+
+    os.makedirs(settings.chroma_path, exist_ok=True)
+    client = chromadb.PersistentClient(path=settings.chroma_path)
+    return client.get_or_create_collection(name=_COLLECTION)
 
 
 def add_chunks(filename: str, chunks: list[str], embeddings: list[list[float]]) -> int:
@@ -29,13 +35,15 @@ def add_chunks(filename: str, chunks: list[str], embeddings: list[list[float]])
         return 0
     ids = [f"{filename}::{uuid.uuid4().hex}" for _ in chunks]
     metadatas = [{"source": filename, "chunk": i} for i in range(len(chunks))]
-    _collection.add(ids=ids, embeddings=embeddings, documents=chunks, metadatas=metadatas)
+    with metrics.stage("store", "chroma").time():
+        _collection().add(ids=ids, embeddings=embeddings, documents=chunks, metadatas=metadatas)
     return len(chunks)
 
 
 def query(embedding: list[float], k: int) -> list[dict]:
     """Return the top-k most similar chunks as {text, source, distance}."""
-    res = _collection.query(query_embeddings=[embedding], n_results=k)
+    with metrics.stage("retrieve", "chroma").time():
+        res = _collection().query(query_embeddings=[embedding], n_results=k)
     docs = (res.get("documents") or [[]])[0]
     metas = (res.get("metadatas") or [[]])[0]
     dists = (res.get("distances") or [[]])[0]
@@ -47,7 +55,7 @@ def query(embedding: list[float], k: int) -> list[dict]:
 
 def list_documents() -> list[dict]:
     """Return distinct ingested documents with their chunk counts."""
-    res = _collection.get(include=["metadatas"])
+    res = _collection().get(include=["metadatas"])
     counts: dict[str, int] = {}
     for meta in res.get("metadatas") or []:
         source = (meta or {}).get("source")
@@ -57,4 +65,4 @@ def list_documents() -> list[dict]:
 
 
 def delete_document(filename: str) -> None:
-    _collection.delete(where={"source": filename})
+    _collection().delete(where={"source": filename})
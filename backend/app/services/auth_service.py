@@ -1,23 +1,22 @@
-"""User authentication: signup (creates a RAG corpus) and signin (JWT)."""
+"""User authentication: signup (assigns a RAG corpus) and signin (JWT)."""
+
+from datetime import datetime, timezone
 
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 from passlib.context import CryptContext
+from pymongo.errors import DuplicateKeyError
 
-import app.config as config
-from app.services.rag_service import create_user_corpus
+from app.core import db
+from app.services import corpus_pool
+from app.services.rag_service import cache_corpus
 from app.core.security import create_access_token
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
-def _users():
-    if config.users is None:
-        raise HTTPException(status_code=503, detail="Online mode is not configured")
-    return config.users
-
-
-def get_user(username: str) -> dict | None:
-    return _users().find_one({"username": username})
+async def get_user(username: str, projection: dict | None = None) -> dict | None:
+    return await db.users().find_one({"username": username}, projection=projection)
 
 
 def hash_password(password: str) -> str:
@@ -28,25 +27,55 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
-def signup_user(data) -> dict:
-    if get_user(data.username):
+async def signup_user(data) -> dict:
+    users = db.users()
+    # Cheap check for the common case; it also keeps names unique should the
+    # unique index be missing (main only logs a failed ensure_indexes).
+    if await get_user(data.username, projection=db.EXISTS):
         raise HTTPException(status_code=400, detail="User already exists")
+    # Then claim the username: with the index in place, concurrent signups for
+    # the same name fail here rather than both taking a corpus.
+    try:
+        await users.insert_one(
+            {
+                "username": data.username,
+                "password": await run_in_threadpool(hash_password, data.password),
+                "corpus": None,
+                "corpus_status": "provisioning",
+                "created_at": datetime.now(timezone.utc),
+            }
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="User already exists")
+
+    # Fast path: take a pre-created corpus from the pool. Otherwise create one
+    # in the background; corpus routes answer 409 until it is ready.
+    corpus = await corpus_pool.claim()
+    if corpus is None:
+        corpus_pool.provision_async(data.username)
+        return {"message": "User created", "corpus": None, "corpus_status": "provisioning"}
 
-    corpus = create_user_corpus(data.username)
-    _users().insert_one(
-        {
-            "username": data.username,
-            "password": hash_password(data.password),
-            "corpus": corpus,
-        }
+    await users.update_one(
+        {"username": data.username}, {"$set": {"corpus": corpus, "corpus_status": "ready"}}
     )
-    return {"message": "User created", "corpus": corpus}
+    cache_corpus(data.username, corpus)
+    return {"message": "User created", "corpus": corpus, "corpus_status": "ready"}
 
 
-def signin_user(data) -> dict:
-    user = get_user(data.username)
-    if not user or not verify_password(data.password, user["password"]):
+async def signin_user(data) -> dict:
+    user = await get_user(data.username, projection=db.CREDENTIALS)
+    # bcrypt is deliberately slow; keep it off the event loop.
+    if not user or not await run_in_threadpool(verify_password, data.password, user["password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    token = create_access_token({"sub": user["username"]})
-    return {"access_token": token}
+    # The corpus rides along as a signed claim so authenticated routes can
+    # resolve it without a database round trip. While it is still being
+    # provisioned the claim is omitted and routes fall back to a lookup.
+    claims = {"sub": user["username"]}
+    if user.get("corpus"):
+        claims["corpus"] = user["corpus"]
+        cache_corpus(user["username"], user["corpus"])
+    return {
+        "access_token": create_access_token(claims),
+        "corpus_status": user.get("corpus_status", "ready" if user.get("corpus") else "provisioning"),
+    }
@@ -0,0 +1,216 @@
+"""Pool of pre-created, unassigned RAG corpora so signup doesn't wait on Vertex.
+
+``rag.create_corpus`` is a long-running operation that takes seconds. Signup
+claims a spare corpus with an atomic ``find_one_and_delete``. When the pool is
+empty, the corpus is provisioned in the background and the user's
+``corpus_status`` stays ``provisioning`` until it is ready.
+
+A background worker runs whenever online mode has MongoDB. Each pass it:
+
+  * repairs users still without a corpus after ``_STALE_PROVISIONING``
+    (their provisioning task was lost to a restart, or gave up as
+    ``failed``), with a pooled corpus or a newly created one;
+  * with ``CORPUS_POOL_TARGET`` > 0, tops the ``corpus_pool`` collection up
+    to the target once it drops below ``CORPUS_POOL_LOW_WATER``.
+
+With several workers, a short lease in the ``leases`` collection makes sure
+only one of them does this at a time.
+
+A corpus is only ever assigned to a user who has none (the update filters on
+``corpus: None``). If provisioning and the stale-user repair race, the loser
+puts its now-unused corpus back in the pool instead of overwriting the
+user's corpus and orphaning their uploads.
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi.concurrency import run_in_threadpool
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.core import db
+from app.settings import settings
+from app.services.rag_service import cache_corpus, create_corpus
+
+logger = logging.getLogger(__name__)
+
+_LEASE_ID = "corpus_pool_refill"
+_LEASE_TTL = timedelta(minutes=5)
+# Users still without a corpus after this long lost their provisioning task
+# (e.g. a worker restart); the refill worker assigns them one.
+_STALE_PROVISIONING = timedelta(minutes=2)
+_PROVISION_ATTEMPTS = 3
+
+_holder = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_wake = asyncio.Event()
+_worker: asyncio.Task | None = None
+_tasks: set[asyncio.Task] = set()
+
+
+def _pool():
+    return db.database()["corpus_pool"]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def claim() -> str | None:
+    """Take the oldest spare corpus, or ``None`` if the pool is empty."""
+    doc = await _pool().find_one_and_delete({}, sort=[("created_at", ASCENDING)])
+    _wake.set()
+    return doc["corpus"] if doc else None
+
+
+async def size() -> int:
+    return await _pool().count_documents({})
+
+
+async def _release(corpus: str) -> None:
+    """Put an unused corpus (back) in the pool."""
+    await _pool().insert_one({"corpus": corpus, "created_at": _now()})
+
+
+async def _assign(username: str, corpus: str) -> bool:
+    """Give ``corpus`` to ``username`` unless they already have one."""
+    result = await db.users().update_one(
+        {"username": username, "corpus": None},
+        {"$set": {"corpus": corpus, "corpus_status": "ready"}},
+    )
+    if not result.matched_count:
+        return False
+    cache_corpus(username, corpus)
+    return True
+
+
+async def _obtain(username: str) -> str:
+    """A pooled corpus, or a newly created one for ``username``."""
+    return await claim() or await run_in_threadpool(create_corpus, f"{username}-corpus")
+
+
+async def _give(username: str, corpus: str) -> None:
+    if await _assign(username, corpus):
+        logger.info("Provisioned corpus for %s", username)
+    else:
+        # Provisioning and the worker's repair raced (or the user is gone).
+        await _release(corpus)
+        logger.info("%s already has a corpus; returned %s to the pool", username, corpus)
+
+
+async def _provision(username: str) -> None:
+    corpus = None
+    for attempt in range(1, _PROVISION_ATTEMPTS + 1):
+        try:
+            corpus = corpus or await _obtain(username)
+            await _give(username, corpus)
+            return
+        except Exception:  # noqa: BLE001 - retried, then reported via corpus_status
+            logger.exception("Corpus provisioning for %s failed (attempt %d)", username, attempt)
+            await asyncio.sleep(2**attempt)
+    await db.users().update_one(
+        {"username": username, "corpus": None}, {"$set": {"corpus_status": "failed"}}
+    )
+
+
+def provision_async(username: str) -> None:
+    """Provision ``username``'s corpus in the background (pool was empty)."""
+    task = asyncio.create_task(_provision(username))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def retry(username: str) -> None:
+    """Re-queue provisioning for a user whose earlier attempts all failed."""
+    # Flipping the status first means concurrent requests queue it once.
+    result = await db.users().update_one(
+        {"username": username, "corpus": None, "corpus_status": "failed"},
+        {"$set": {"corpus_status": "provisioning"}},
+    )
+    if result.modified_count:
+        provision_async(username)
+
+
+async def _acquire_lease() -> bool:
+    now = _now()
+    try:
+        doc = await db.database()["leases"].find_one_and_update(
+            {"_id": _LEASE_ID, "$or": [{"expires_at": {"$lt": now}}, {"holder": _holder}]},
+            {"$set": {"holder": _holder, "expires_at": now + _LEASE_TTL}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        return False  # another worker holds an unexpired lease
+    return doc is not None and doc["holder"] == _holder
+
+
+async def _repair_stale_users() -> None:
+    cutoff = _now() - _STALE_PROVISIONING
+    cursor = db.users().find(
+        {"corpus": None, "corpus_status": {"$in": ["provisioning", "failed"]},
+         "created_at": {"$lt": cutoff}},
+        projection={"_id": 0, "username": 1},
+    )
+    async for user in cursor:
+        try:
+            await _give(user["username"], await _obtain(user["username"]))
+        except Exception:  # noqa: BLE001 - one user must not block the rest; retried next pass
+            logger.exception("Repairing the corpus of %s failed", user["username"])
+
+
+async def refill_once() -> int:
+    """Repair stale users, then top the pool up if it is below the low-water mark."""
+    if not await _acquire_lease():
+        return 0
+    await _repair_stale_users()
+    if settings.corpus_pool_target <= 0:
+        return 0
+    current = await size()
+    if current >= settings.corpus_pool_low_water:
+        return 0
+
+    created = 0
+    for _ in range(settings.corpus_pool_target - current):
+        corpus = await run_in_threadpool(create_corpus, f"pool-{uuid.uuid4().hex[:12]}")
+        await _pool().insert_one({"corpus": corpus, "created_at": _now()})
+        created += 1
+    logger.info("Corpus pool refilled with %d corpora", created)
+    return created
+
+
+async def _refill_loop() -> None:
+    while True:
+        try:
+            await refill_once()
+        except Exception:  # noqa: BLE001 - keep the worker alive; retry next tick
+            logger.exception("Corpus pool pass failed")
+        _wake.clear()
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=settings.corpus_pool_refill_interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start() -> None:
+    """Start the background worker (no-op unless online mode has MongoDB).
+
+    It runs even with the pool disabled: it is what repairs users whose
+    provisioning was lost or failed.
+    """
+    global _worker
+    if not settings.cloud_enabled or not db.configured():
+        return
+    if _worker is None or _worker.done():
+        _worker = asyncio.create_task(_refill_loop())
+
+
+async def stop() -> None:
+    """Cancel the refill worker and any in-flight provisioning."""
+    tasks = [*_tasks, *([_worker] if _worker is not None else [])]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
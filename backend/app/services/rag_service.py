@@ -1,36 +1,140 @@
-"""Online RAG corpus operations backed by Vertex AI RAG Engine."""
+"""Online RAG corpus operations backed by Vertex AI RAG Engine.
 
+The Vertex SDK is fetched through ``config.vertex_rag`` inside the functions
+that call it, so it is only loaded (and initialised) once online mode is used.
+"""
+
+import asyncio
+import json
 import logging
 import os
 import tempfile
+import time
+from typing import AsyncIterator
 
 from fastapi import HTTPException
-from vertexai import rag
+from fastapi.concurrency import run_in_threadpool
 
-import app.config as config
+from app.config import vertex_rag
+from app.core import db, metrics
+from app.settings import settings
+from app.services import retrieval
 
 logger = logging.getLogger(__name__)
 
-# Retrieval tuning for the online corpus.
-TOP_K = 10
-VECTOR_DISTANCE_THRESHOLD = 0.5
 EMBEDDING_MODEL = "publishers/google/models/text-embedding-005"
+# Per-process bound on each per-user lookup cache.
+_CACHE_MAX_ENTRIES = 10_000
+
+
+class _TTLCache:
+    """Tiny bounded TTL cache for per-user lookups served on every request."""
+
+    def __init__(self, max_entries: int = _CACHE_MAX_ENTRIES) -> None:
+        self._max_entries = max_entries
+        self._items: dict[str, tuple[object, float]] = {}
+
+    def get(self, key: str):
+        hit = self._items.get(key)
+        if hit and hit[1] > time.monotonic():
+            return hit[0]
+        return None
+
+    def set(self, key: str, value) -> None:
+        now = time.monotonic()
+        if len(self._items) >= self._max_entries:
+            for k in [k for k, (_, exp) in self._items.items() if exp <= now]:
+                del self._items[k]
+            if len(self._items) >= self._max_entries:
+                self._items.pop(next(iter(self._items)))
+        self._items[key] = (value, now + settings.corpus_cache_ttl_seconds)
+
+    def pop(self, key: str) -> None:
+        self._items.pop(key, None)
+
+
+# username -> own corpus. Only ready corpora are cached. Signup may leave a
+# user without one while it is provisioned in the background (see
+# corpus_pool), and assignment then fills it in once; a cached corpus is not
+# reassigned afterwards. The TTL bounds staleness if a user is removed.
+_corpus_cache = _TTLCache()
+# username -> shared corpora the user has been granted. Grants made on this
+# worker invalidate immediately; other workers pick them up within the TTL.
+_shared_cache = _TTLCache()
+
+
+def cache_corpus(username: str, corpus: str) -> None:
+    _corpus_cache.set(username, corpus)
+
+
+def invalidate_corpus(username: str) -> None:
+    _corpus_cache.pop(username)
+    _shared_cache.pop(username)
 
 
-def _get_user(username: str) -> dict:
-    """Look up a user (and their corpus) or raise 404."""
-    if config.users is None:
-        raise HTTPException(status_code=503, detail="Online mode is not configured")
-    user = config.users.find_one({"username": username})
-    if not user:
+def cached_corpus(user: dict) -> str | None:
+    """Return the corpus for JWT claims ``user`` without touching MongoDB.
+
+    Tokens issued at signin carry a signed ``corpus`` claim; older tokens fall
+    back to the in-process cache. ``None`` means a database lookup is needed.
+    """
+    return user.get("corpus") or _corpus_cache.get(user["sub"])
+
+
+async def resolve_corpus(user: dict) -> str:
+    """Return the user's corpus, consulting MongoDB only on a cache miss."""
+    corpus = cached_corpus(user)
+    metrics.cache("corpus", corpus is not None)
+    if corpus:
+        return corpus
+    with metrics.stage("mongo", "users").time():
+        doc = await db.users().find_one({"username": user["sub"]}, projection=db.CORPUS_STATE)
+    if not doc:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    if not doc.get("corpus"):
+        if doc.get("corpus_status") == "failed":
+            # Imported here: corpus_pool builds on this module.
+            from app.services import corpus_pool
 
+            await corpus_pool.retry(user["sub"])
+            raise HTTPException(
+                status_code=503, detail="Creating your document corpus failed; retrying now"
+            )
+        raise HTTPException(status_code=409, detail="Your document corpus is still being created")
+    cache_corpus(user["sub"], doc["corpus"])
+    return doc["corpus"]
 
-def create_user_corpus(username: str) -> str:
-    """Create a per-user RAG corpus and return its resource name."""
+
+def cached_corpora(user: dict) -> tuple[str, ...] | None:
+    """Every corpus ``user`` can search (own first), or ``None`` on a cache miss."""
+    own = cached_corpus(user)
+    shared = _shared_cache.get(user["sub"])
+    if own is None or shared is None:
+        return None
+    return (own, *shared)
+
+
+async def resolve_corpora(user: dict) -> tuple[str, ...]:
+    """Return the user's own corpus followed by the shared corpora granted to them."""
+    corpora = cached_corpora(user)
+    metrics.cache("corpora", corpora is not None)
+    if corpora is not None:
+        return corpora
+    own = await resolve_corpus(user)
+    with metrics.stage("mongo", "shared_corpora").time():
+        cursor = db.shared_corpora().find({"members": user["sub"]}, projection=db.CORPUS_ONLY)
+        shared = tuple(
+            [d["corpus"] async for d in cursor.sort("name", 1) if d["corpus"] not in (None, own)]
+        )
+    _shared_cache.set(user["sub"], shared)
+    return (own, *shared)
+
+
+def create_corpus(display_name: str) -> str:
+    """Create a RAG corpus and return its resource name."""
+    rag = vertex_rag()
     corpus = rag.create_corpus(
-        display_name=f"{username}-corpus",
+        display_name=display_name,
         backend_config=rag.RagVectorDbConfig(
             rag_embedding_model_config=rag.RagEmbeddingModelConfig(
                 vertex_prediction_endpoint=rag.VertexPredictionEndpoint(
@@ -42,9 +146,17 @@ def create_user_corpus(username: str) -> str:
     return corpus.name
 
 
-def upload_user_file(username: str, file) -> dict:
-    user = _get_user(username)
+def create_user_corpus(username: str) -> str:
+    """Create a per-user RAG corpus and return its resource name."""
+    return create_corpus(f"{username}-corpus")
+
+
+async def upload_user_file(user: dict, file) -> dict:
+    return await run_in_threadpool(upload_to_corpus, await resolve_corpus(user), file)
+
 
+def upload_to_corpus(corpus: str, file) -> dict:
+    rag = vertex_rag()
     suffix = os.path.splitext(file.filename or "")[1]
     with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
         tmp.write(file.file.read())
@@ -52,40 +164,97 @@ def upload_user_file(username: str, file) -> dict:
 
     try:
         rag_file = rag.upload_file(
-            corpus_name=user["corpus"], path=temp_path, display_name=file.filename
+            corpus_name=corpus, path=temp_path, display_name=file.filename
         )
     finally:
         os.remove(temp_path)
 
-    logger.info("Uploaded %s to corpus %s", file.filename, user["corpus"])
+    logger.info("Uploaded %s to corpus %s", file.filename, corpus)
     return {"message": "File uploaded", "file_id": rag_file.name}
 
 
-def delete_user_file(username: str, request) -> dict:
-    user = _get_user(username)
-
-    files = rag.list_files(corpus_name=user["corpus"]).rag_files
-    file_to_delete = next((f for f in files if f.display_name == request.file_name), None)
+def _delete_file(corpus: str, file_name: str) -> dict:
+    rag = vertex_rag()
+    files = rag.list_files(corpus_name=corpus).rag_files
+    file_to_delete = next((f for f in files if f.display_name == file_name), None)
     if not file_to_delete:
         raise HTTPException(status_code=404, detail="File not found")
 
     rag.delete_file(name=file_to_delete.name)
-    return {"message": f"File '{request.file_name}' deleted"}
+    return {"message": f"File '{file_name}' deleted"}
+
+
+async def delete_user_file(user: dict, request) -> dict:
+    return await run_in_threadpool(_delete_file, await resolve_corpus(user), request.file_name)
 
 
-def list_user_files(username: str) -> list[dict]:
-    user = _get_user(username)
-    files = rag.list_files(corpus_name=user["corpus"]).rag_files
+def _list_files(corpus: str) -> list[dict]:
+    rag = vertex_rag()
+    files = rag.list_files(corpus_name=corpus).rag_files
     return [{"name": f.name, "display_name": f.display_name} for f in files]
 
 
-def retrieve_context_service(username: str, text: str) -> dict:
-    user = _get_user(username)
-    response = rag.retrieval_query(
-        rag_resources=[rag.RagResource(rag_corpus=user["corpus"])],
-        rag_retrieval_config=rag.RagRetrievalConfig(
-            top_k=TOP_K, filter=rag.Filter(vector_distance_threshold=VECTOR_DISTANCE_THRESHOLD)
-        ),
-        text=text,
-    )
-    return {"contexts": [ctx.text for ctx in response.contexts.contexts]}
+async def list_user_files(user: dict) -> list[dict]:
+    return await run_in_threadpool(_list_files, await resolve_corpus(user))
+
+
+async def _retrieve_texts(corpora: tuple[str, ...], text: str) -> list[str]:
+    try:
+        contexts = await retrieval.retrieve(corpora, text)
+    except retrieval.RetrievalUnavailable:
+        raise HTTPException(status_code=503, detail="Document search is temporarily unavailable")
+    return [ctx["text"] for ctx in contexts]
+
+
+async def retrieve_context_service(user: dict, text: str) -> dict:
+    return {"contexts": await _retrieve_texts(await resolve_corpora(user), text)}
+
+
+async def _timed_retrieve(
+    corpora: tuple[str, ...], index: int, text: str, limit: asyncio.Semaphore
+) -> dict:
+    async with limit:
+        start = time.perf_counter()
+        result: dict = {"index": index, "query": text}
+        try:
+            result["contexts"] = await _retrieve_texts(corpora, text)
+        except Exception as exc:  # noqa: BLE001 - one failed query must not sink the batch
+            logger.warning("Batch retrieval %d failed: %s", index, exc)
+            result["error"] = str(exc)
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+
+async def iter_retrieve_batch(
+    corpora: tuple[str, ...], queries: list[str]
+) -> AsyncIterator[dict]:
+    """Yield one result per query as it completes (tagged with its ``index``).
+
+    At most ``settings.batch_retrieve_concurrency`` retrievals are in flight.
+    """
+    limit = asyncio.Semaphore(settings.batch_retrieve_concurrency)
+    tasks = [
+        asyncio.create_task(_timed_retrieve(corpora, i, q, limit)) for i, q in enumerate(queries)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Client went away (or the consumer stopped early): drop the rest.
+        for task in tasks:
+            task.cancel()
+
+
+async def retrieve_batch_service(corpora: tuple[str, ...], queries: list[str]) -> dict:
+    """Run ``queries`` against ``corpora`` and return results in request order."""
+    start = time.perf_counter()
+    results: list[dict] = [{}] * len(queries)
+    async for result in iter_retrieve_batch(corpora, queries):
+        results[result["index"]] = result
+    return {"results": results, "total_ms": round((time.perf_counter() - start) * 1000, 1)}
+
+
+async def stream_retrieve_batch(corpora: tuple[str, ...], queries: list[str]):
+    """Async generator yielding NDJSON lines, one per query as it completes."""
+    async for result in iter_retrieve_batch(corpora, queries):
+        yield json.dumps(result) + "\n"
@@ -0,0 +1,359 @@
+"""Federated retrieval across every Vertex AI RAG corpus a user can read.
+
+A user searches their own corpus plus any shared organisation corpora they
+have been granted. RAG Engine queries one corpus per call, so ``retrieve``
+fans the query out in parallel, merges the hits by vector distance (lower is
+closer) and drops duplicate passages before they reach the agent or the API.
+
+Each per-corpus query goes through ``RetrievalClient``, which bounds Vertex
+tail latency:
+
+  * **deadline**: a corpus query gives up after ``RETRIEVAL_DEADLINE_SECONDS``;
+  * **hedging**: if the first attempt is still running after the recent p95
+    latency, a duplicate is sent and whichever answers first wins. At most
+    ``RETRIEVAL_HEDGE_MAX_RATIO`` of queries hedge, so a slow Vertex doesn't
+    get twice the load. A losing attempt can't be interrupted (the SDK is
+    synchronous); its result is discarded;
+  * **circuit breaker**: after ``RETRIEVAL_BREAKER_FAILURES`` consecutive
+    failures, a corpus isn't queried for ``RETRIEVAL_BREAKER_COOLDOWN_SECONDS``.
+    After the cooldown one trial query decides whether it closes again;
+  * **degraded results**: when a query fails, times out or is short-circuited,
+    the last good result for the same corpus and query is served if it is
+    younger than ``RETRIEVAL_CACHE_MAX_AGE_SECONDS``. Otherwise the call raises
+    ``RetrievalUnavailable``.
+
+Attempts are exported as ``ragai_retrieval_attempt_seconds`` (by attempt and
+outcome) and calls as ``ragai_retrieval_calls_total`` (by result).
+``bench/retrieval_bench.py`` exercises the client against a fake Vertex with
+injected latency and errors.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from app.config import vertex_rag
+from app.core import metrics
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Retrieval tuning for the online corpora.
+TOP_K = 10
+VECTOR_DISTANCE_THRESHOLD = 0.5
+
+# Hedge delay until enough latencies have been seen to estimate a p95.
+DEFAULT_HEDGE_DELAY = 1.0
+_MIN_SAMPLES = 20
+
+# The Vertex RAG SDK is synchronous; its calls run on this bounded pool so a
+# burst of retrievals can't exhaust the default executor.
+_executor = ThreadPoolExecutor(
+    max_workers=settings.tool_max_workers, thread_name_prefix="rag-retrieve"
+)
+
+ATTEMPT_SECONDS = metrics.Histogram(
+    "ragai_retrieval_attempt_seconds",
+    "Individual Vertex retrieval attempts (primary or hedge) by outcome.",
+    ("attempt", "outcome"),
+)
+CALLS = metrics.Counter(
+    "ragai_retrieval_calls_total",
+    "Per-corpus retrievals by result (which attempt won, or how it degraded).",
+    ("result",),
+)
+
+
+class RetrievalUnavailable(Exception):
+    """A corpus query failed, timed out or was short-circuited, with nothing cached."""
+
+
+def query_corpus(corpus: str, text: str) -> list[dict]:
+    """Query a single corpus; return ``{text, source, score}`` contexts."""
+    rag = vertex_rag()  # loaded on first use, not at import
+    response = rag.retrieval_query(
+        rag_resources=[rag.RagResource(rag_corpus=corpus)],
+        rag_retrieval_config=rag.RagRetrievalConfig(
+            top_k=TOP_K,
+            filter=rag.Filter(vector_distance_threshold=VECTOR_DISTANCE_THRESHOLD),
+        ),
+        text=text,
+    )
+
+    contexts = []
+    for ctx in response.contexts.contexts:
+        score = getattr(ctx, "score", None)
+        if score is None:
+            score = getattr(ctx, "distance", None)
+        contexts.append(
+            {
+                "text": ctx.text,
+                # Different RAG Engine versions expose the file name under
+                # different attributes; fall back gracefully.
+                "source": getattr(ctx, "source_display_name", None)
+                or getattr(ctx, "source_uri", None)
+                or "document",
+                "score": score,
+            }
+        )
+    return contexts
+
+
+class _Breaker:
+    __slots__ = ("failures", "opened_at", "probing")
+
+    def __init__(self) -> None:
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+
+
+class RetrievalClient:
+    """Deadline, hedging, circuit breaker and last-good cache around ``query``.
+
+    ``query`` is the blocking single-corpus call (``query_corpus``); it runs on
+    ``executor``. Breaker and cache state is only touched on the event loop;
+    the latency window is shared with worker threads under a lock.
+    """
+
+    def __init__(
+        self,
+        query: Callable[[str, str], list[dict]] = query_corpus,
+        executor: ThreadPoolExecutor = _executor,
+        deadline: float | None = None,
+        hedge: bool | None = None,
+        hedge_min: float | None = None,
+        hedge_max_ratio: float | None = None,
+        breaker_failures: int | None = None,
+        breaker_cooldown: float | None = None,
+        cache_entries: int | None = None,
+        cache_max_age: float | None = None,
+    ) -> None:
+        def pick(value, default):
+            return default if value is None else value
+
+        self._query = query
+        self._executor = executor
+        self.deadline = pick(deadline, settings.retrieval_deadline_seconds)
+        self.hedge = pick(hedge, settings.retrieval_hedge)
+        self.hedge_min = pick(hedge_min, settings.retrieval_hedge_min_seconds)
+        self.hedge_max_ratio = pick(hedge_max_ratio, settings.retrieval_hedge_max_ratio)
+        self.breaker_failures = pick(breaker_failures, settings.retrieval_breaker_failures)
+        self.breaker_cooldown = pick(breaker_cooldown, settings.retrieval_breaker_cooldown_seconds)
+        self.cache_entries = pick(cache_entries, settings.retrieval_cache_entries)
+        self.cache_max_age = pick(cache_max_age, settings.retrieval_cache_max_age_seconds)
+
+        self._latencies: deque[float] = deque(maxlen=256)
+        self._latency_lock = threading.Lock()
+        self._calls = 0
+        self._hedges = 0
+        self._breakers: dict[str, _Breaker] = {}
+        # (corpus, normalised query) -> (contexts, stored at), least recent first.
+        self._cache: OrderedDict[tuple[str, str], tuple[list[dict], float]] = OrderedDict()
+
+    # --- Public API -------------------------------------------------------------
+
+    async def query(self, corpus: str, text: str) -> list[dict]:
+        """Contexts for one corpus, degrading to cached results on failure."""
+        key = (corpus, " ".join(text.split()).lower())
+        if not self._allow(corpus):
+            return self._fallback(key, "breaker_open")
+        start = time.perf_counter()
+        try:
+            contexts, winner = await self._hedged(corpus, text)
+        except asyncio.CancelledError:
+            self._abandoned(corpus)
+            raise
+        except Exception as exc:  # noqa: BLE001 - any upstream failure degrades the same way
+            self._failed(corpus)
+            reason = "timeout" if isinstance(exc, asyncio.TimeoutError) else "error"
+            logger.warning("Retrieval from %s failed (%s): %r", corpus, reason, exc)
+            return self._fallback(key, reason)
+        metrics.stage("retrieve", "vertex").observe(time.perf_counter() - start)
+        self._succeeded(corpus)
+        CALLS.labels(winner).inc()
+        self._remember(key, contexts)
+        return contexts
+
+    def hedge_delay(self) -> float:
+        with self._latency_lock:
+            samples = sorted(self._latencies)
+        if len(samples) < _MIN_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        return max(samples[int(len(samples) * 0.95) - 1], self.hedge_min)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "hedge_delay_seconds": round(self.hedge_delay(), 4),
+            "calls": self._calls,
+            "hedges": self._hedges,
+            "open_breakers": sum(
+                1 for b in self._breakers.values()
+                if b.opened_at is not None and now - b.opened_at < self.breaker_cooldown
+            ),
+            "cached": len(self._cache),
+        }
+
+    # --- Attempts -----------------------------------------------------------------
+
+    def _attempt(self, kind: str, corpus: str, text: str) -> list[dict]:
+        start = time.perf_counter()
+        try:
+            contexts = self._query(corpus, text)
+        except Exception:
+            ATTEMPT_SECONDS.labels(kind, "error").observe(time.perf_counter() - start)
+            raise
+        elapsed = time.perf_counter() - start
+        ATTEMPT_SECONDS.labels(kind, "ok").observe(elapsed)
+        with self._latency_lock:
+            self._latencies.append(elapsed)
+        return contexts
+
+    def _may_hedge(self) -> bool:
+        if not self.hedge or self._hedges >= self.hedge_max_ratio * self._calls:
+            return False
+        self._hedges += 1
+        return True
+
+    async def _hedged(self, corpus: str, text: str) -> tuple[list[dict], str]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        self._calls += 1
+        if self._calls >= 10_000:  # keep the hedge ratio responsive to recent traffic
+            self._calls //= 2
+            self._hedges //= 2
+
+        primary = loop.run_in_executor(self._executor, self._attempt, "primary", corpus, text)
+        attempts = {primary: "primary"}
+        pending = {primary}
+        delay = min(self.hedge_delay(), self.deadline)
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        # A hedge sent as the deadline runs out could never be waited for.
+        if not done and loop.time() < deadline and self._may_hedge():
+            hedge = loop.run_in_executor(self._executor, self._attempt, "hedge", corpus, text)
+            attempts[hedge] = "hedge"
+            pending.add(hedge)
+
+        error: BaseException | None = None
+        try:
+            while True:
+                for future in done:
+                    if future.exception() is None:
+                        return future.result(), attempts[future]
+                    error = future.exception()
+                if not pending:
+                    raise error
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError(f"no answer within {self.deadline}s")
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+        finally:
+            for future in pending:
+                # Still running in a worker thread; just don't wait for it.
+                future.add_done_callback(_discard)
+
+    # --- Breaker and cache (event loop only) ----------------------------------------
+
+    def _allow(self, corpus: str) -> bool:
+        breaker = self._breakers.get(corpus)
+        if breaker is None or breaker.opened_at is None:
+            return True
+        if breaker.probing or time.monotonic() - breaker.opened_at < self.breaker_cooldown:
+            return False
+        breaker.probing = True  # half-open: this call is the trial
+        return True
+
+    def _succeeded(self, corpus: str) -> None:
+        self._breakers.pop(corpus, None)
+
+    def _failed(self, corpus: str) -> None:
+        breaker = self._breakers.setdefault(corpus, _Breaker())
+        breaker.failures += 1
+        if breaker.probing or breaker.failures >= self.breaker_failures:
+            if breaker.opened_at is None:
+                logger.warning("Retrieval circuit for %s open for %ss", corpus, self.breaker_cooldown)
+            breaker.opened_at = time.monotonic()
+            breaker.probing = False
+
+    def _abandoned(self, corpus: str) -> None:
+        # A cancelled trial proves nothing; let the next call try instead.
+        breaker = self._breakers.get(corpus)
+        if breaker is not None:
+            breaker.probing = False
+
+    def _remember(self, key: tuple[str, str], contexts: list[dict]) -> None:
+        if self.cache_entries <= 0:
+            return
+        self._cache[key] = (contexts, time.monotonic())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_entries:
+            self._cache.popitem(last=False)
+
+    def _fallback(self, key: tuple[str, str], reason: str) -> list[dict]:
+        hit = self._cache.get(key)
+        if hit is not None and time.monotonic() - hit[1] <= self.cache_max_age:
+            CALLS.labels(f"cached_{reason}").inc()
+            return hit[0]
+        CALLS.labels(reason).inc()
+        raise RetrievalUnavailable(f"Retrieval from {key[0]} unavailable ({reason})")
+
+
+def _discard(future: asyncio.Future) -> None:
+    if not future.cancelled():
+        future.exception()  # mark retrieved; the result is no longer wanted
+
+
+client = RetrievalClient()
+
+
+def merge_contexts(results: list[list[dict]], top_k: int = TOP_K) -> list[dict]:
+    """Merge per-corpus hits by score and keep the best copy of each passage."""
+    best: dict[str, dict] = {}
+    for contexts in results:
+        for ctx in contexts:
+            key = " ".join(ctx["text"].split())
+            held = best.get(key)
+            if held is None or _rank(ctx) < _rank(held):
+                best[key] = ctx
+    return sorted(best.values(), key=_rank)[:top_k]
+
+
+def _rank(ctx: dict) -> float:
+    score = ctx.get("score")
+    return float("inf") if score is None else score
+
+
+async def retrieve(corpora: tuple[str, ...] | list[str], text: str) -> list[dict]:
+    """Query ``corpora`` concurrently and return the merged, deduplicated hits.
+
+    A corpus that fails is logged and skipped so one bad shared corpus does
+    not take down the user's own results. If none succeeds this raises
+    (``RetrievalUnavailable`` for several corpora) rather than returning
+    ``[]``, which would read as "no relevant passages".
+    """
+    outcomes = await asyncio.gather(
+        *(client.query(c, text) for c in corpora), return_exceptions=True
+    )
+    results = []
+    for corpus, outcome in zip(corpora, outcomes):
+        if isinstance(outcome, BaseException):
+            if len(corpora) > 1:
+                logger.warning("Retrieval from %s failed: %s", corpus, outcome)
+            continue
+        results.append(outcome)
+    if corpora and not results:
+        if len(corpora) == 1:
+            raise outcomes[0]
+        raise RetrievalUnavailable(
+            f"Retrieval from all {len(corpora)} corpora failed"
+        ) from outcomes[-1]
+    return merge_contexts(results)
@@ -0,0 +1,75 @@
+"""Shared organisation corpora: one RAG corpus searched by many users.
+
+A shared corpus is ingested and stored once; members are granted access and
+their retrievals fan out across it alongside their own corpus (see
+``services.retrieval``). Documents live in the ``shared_corpora`` collection
+as ``{name, corpus, owner, members}``; only the owner can grant access.
+"""
+
+import logging
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from pymongo.errors import DuplicateKeyError
+
+from app.core import db
+from app.services.rag_service import create_corpus, invalidate_corpus, upload_to_corpus
+
+logger = logging.getLogger(__name__)
+
+
+async def _get_shared(name: str, username: str) -> dict:
+    doc = await db.shared_corpora().find_one(
+        {"name": name, "members": username}, projection={"_id": 0, "corpus": 1, "owner": 1}
+    )
+    if not doc:
+        raise HTTPException(status_code=404, detail="Shared corpus not found")
+    if not doc.get("corpus"):
+        raise HTTPException(status_code=409, detail="Shared corpus is still being created")
+    return doc
+
+
+async def create_shared_corpus(username: str, data) -> dict:
+    shared = db.shared_corpora()
+    # Claim the name first (unique index) so concurrent creates can't both
+    # provision a Vertex corpus.
+    try:
+        await shared.insert_one(
+            {"name": data.name, "corpus": None, "owner": username, "members": [username]}
+        )
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Shared corpus already exists")
+
+    try:
+        corpus = await run_in_threadpool(create_corpus, f"shared-{data.name}")
+    except Exception:
+        await shared.delete_one({"name": data.name})
+        raise
+    await shared.update_one({"name": data.name}, {"$set": {"corpus": corpus}})
+    invalidate_corpus(username)
+    logger.info("Created shared corpus %s (%s) for %s", data.name, corpus, username)
+    return {"message": "Shared corpus created", "name": data.name, "corpus": corpus}
+
+
+async def grant_shared_corpus(username: str, name: str, data) -> dict:
+    doc = await _get_shared(name, username)
+    if doc["owner"] != username:
+        raise HTTPException(status_code=403, detail="Only the owner can grant access")
+    if not await db.users().find_one({"username": data.username}, projection=db.EXISTS):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    await db.shared_corpora().update_one({"name": name}, {"$addToSet": {"members": data.username}})
+    invalidate_corpus(data.username)
+    return {"message": f"Granted '{data.username}' access to '{name}'"}
+
+
+async def list_shared_corpora(username: str) -> list[dict]:
+    cursor = db.shared_corpora().find(
+        {"members": username}, projection={"_id": 0, "name": 1, "owner": 1}
+    )
+    return [d async for d in cursor.sort("name", 1)]
+
+
+async def upload_shared_file(username: str, name: str, file) -> dict:
+    doc = await _get_shared(name, username)
+    return await run_in_threadpool(upload_to_corpus, doc["corpus"], file)
@@ -29,10 +29,47 @@ class Settings(BaseSettings):
     # Google ADC, e.g. Azure Container Apps). Takes precedence over a path.
     google_credentials_json: str | None = None
     mongo_uri: str | None = None
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 0
+    mongo_timeout_ms: int = 5000
     jwt_secret: str = "change-me-in-production"
     jwt_algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     model_id: str = "gemini-2.5-flash"
+    # Spare pre-created corpora kept for instant signup; refilled up to the
+    # target once the pool drops below the low-water mark. Opt-in (0 disables
+    # the pool), since every spare is a billable corpus. The same worker also
+    # gives a corpus to users whose provisioning was lost or failed, every
+    # refill interval, whether or not the pool is enabled.
+    corpus_pool_target: int = 0
+    corpus_pool_low_water: int = 3
+    corpus_pool_refill_interval: float = 60.0
+    # How long a username -> corpus lookup is served from the in-process cache.
+    corpus_cache_ttl_seconds: int = 300
+    # Max prebuilt agent + Runner pairs kept in memory (LRU, one per corpus).
+    agent_pool_size: int = 256
+    # Per-call deadline for agent tools, and the thread pool size for the
+    # blocking Vertex RAG SDK retrieval calls.
+    tool_timeout_seconds: float = 20.0
+    tool_max_workers: int = 16
+    # Default for the retrieve-first fast path (requests may override with
+    # "fast"): retrieval runs up front and is injected into the first model
+    # turn, saving one LLM round trip.
+    agent_fast_mode: bool = False
+    # Max concurrent Vertex retrievals per /rag/retrieve-batch call.
+    batch_retrieve_concurrency: int = 8
+    # Per-corpus Vertex retrieval policy (see app.services.retrieval): a
+    # deadline, a hedged duplicate once the first attempt passes the recent
+    # p95 (at most hedge_max_ratio of calls), and a circuit breaker that
+    # serves the last good result for the same query while Vertex is failing.
+    retrieval_deadline_seconds: float = 8.0
+    retrieval_hedge: bool = True
+    retrieval_hedge_min_seconds: float = 0.05
+    retrieval_hedge_max_ratio: float = 0.1
+    retrieval_breaker_failures: int = 5
+    retrieval_breaker_cooldown_seconds: float = 30.0
+    retrieval_cache_entries: int = 5000
+    retrieval_cache_max_age_seconds: float = 3600.0
 
     # --- Offline / local (Ollama + ChromaDB) ---
     ollama_host: str = "http://localhost:11434"
@@ -43,9 +80,76 @@ class Settings(BaseSettings):
     chunk_overlap: int = 150
     retrieval_top_k: int = 5
 
+    # --- Model routing (see app.core.routing) ---
+    # Simple questions go to the fast model, the rest to model_id /
+    # ollama_llm_model. Routing is off for a backend until its fast model is set.
+    fast_model_id: str | None = None
+    ollama_fast_llm_model: str | None = None
+    # A question is routed fast only if it is short, not analytical, early in
+    # the session (route_max_history user/model messages), and (when passages
+    # are known up front) the closest passage is near enough. Distances are
+    # per backend, lower is closer: Vertex reports cosine distance, Chroma
+    # squared L2 (0.6 on Ollama's unit-length embeddings matches cosine 0.3).
+    route_max_query_chars: int = 200
+    route_max_history: int = 6
+    route_max_distance_vertex: float = 0.3
+    route_max_distance_chroma: float = 0.6
+    # Fast answers that open like a non-answer are regenerated by the strong
+    # model; streams hold back this many characters to decide.
+    route_escalate: bool = True
+    route_probe_chars: int = 160
+
+    # --- Online agent sessions ---
+    # "memory" (single process), "mongo" (shared via MONGO_URI) or "sql" (ADK's
+    # DatabaseSessionService, e.g. SQLite locally). Empty picks mongo when
+    # MONGO_URI is set, else memory.
+    session_backend: str = ""
+    session_db_url: str = "sqlite+aiosqlite:///./data/sessions.db"
+    session_ttl_hours: int = 24 * 7
+    # Write-behind: buffered events are flushed at the end of each turn, or
+    # sooner when either of these limits is reached.
+    session_flush_interval: float = 1.0
+    session_flush_max_events: int = 50
+
+    # --- Streaming (SSE) ---
+    # Tokens are coalesced into one frame per window or once this many
+    # characters are buffered; a heartbeat comment is sent when idle.
+    sse_coalesce_ms: int = 25
+    sse_coalesce_chars: int = 512
+    sse_heartbeat_seconds: float = 15.0
+    # Frames buffered ahead of a slow client before generation pauses.
+    sse_queue_size: int = 64
+
+    # --- Admission control (LLM-bound requests, see app.core.admission) ---
+    # Concurrent generations per backend (0 disables the limit). Ollama on
+    # one machine saturates quickly; Gemini is bounded by quota.
+    admission_adk_limit: int = 32
+    admission_ollama_limit: int = 2
+    # Waiting requests per backend, and per user within that, before 429s.
+    admission_queue_size: int = 128
+    admission_user_queue: int = 4
+    # Requests expected to wait (or actually waiting) longer get a 429.
+    admission_max_wait_seconds: float = 10.0
+
+    # --- Slow-query capture (opt-in, see app.core.capture) ---
+    # Queries slower than capture_slow_ms are always written (0 disables),
+    # plus a random capture_sample_rate fraction of all queries.
+    capture_enabled: bool = False
+    capture_path: str = "./data/capture/queries.jsonl"
+    capture_slow_ms: float = 5000.0
+    capture_sample_rate: float = 0.01
+    capture_max_bytes: int = 50_000_000
+    capture_backups: int = 5
+    # Longer questions, passages and answers are truncated in the record.
+    capture_max_chars: int = 4000
+
     # --- Server ---
     # Comma-separated list of allowed CORS origins, or "*" for all.
     cors_origins: str = "*"
+    # Load and initialise the online SDKs (Vertex AI, Gemini, ADK) in the
+    # background right after startup. When off they load on the first online
+    # request instead. /health answers before either happens.
+    startup_warmup: bool = True
 
     @property
     def cors_origins_list(self) -> list[str]:
@@ -58,6 +162,12 @@ class Settings(BaseSettings):
         # instance (GCP workload identity, mounted ADC, etc.).
         return bool(self.project_id)
 
+    @property
+    def online_enabled(self) -> bool:
+        # The online routes (auth, files, RAG, shared corpora) need MongoDB
+        # and/or Vertex AI; without either they are not loaded at all.
+        return self.cloud_enabled or bool(self.mongo_uri)
+
 
 @lru_cache
 def get_settings() -> Settings:
@@ -0,0 +1,198 @@
+"""Local stand-ins for Vertex AI RAG Engine and Gemini, for load tests.
+
+``FakeVertexRag`` replaces the ``vertexai.rag`` calls the online stack makes
+(``retrieval_query``, ``list_files``, ``upload_file``, ``delete_file``). Like
+the real SDK they are synchronous, so they block whichever worker thread runs
+them for the sampled latency. Retrieval returns passages seeded from the
+corpus and query, so a given request always gets the same results. Faults can
+be injected too: a ``stall_rate`` share of retrievals take an extra ``stall``
+delay (the multi-second tail), and an ``error_rate`` share raise.
+
+``FakeGemini`` is an ADK ``BaseLlm``. Set it as the agent model and the real
+ADK ``Runner``, session service, function tools and SSE path all run
+unchanged. The first turn calls ``retrieve_documents`` when the agent has that
+tool. Once the tool response is in the request (or straight away for a
+prefetched fast-mode agent), it streams ``tokens`` words. Delays are
+``asyncio`` sleeps, like a real network call.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import random
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import AsyncGenerator, ClassVar
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from bench.latency import Latency
+
+_WORDS = (
+    "the handbook states that requests are approved by a manager within five "
+    "working days and recorded in the shared system with a reference number"
+).split()
+
+
+def _rng(*parts: str) -> random.Random:
+    return random.Random(hashlib.sha256("\x00".join(parts).encode()).hexdigest())
+
+
+class FakeVertexRag:
+    """Patch ``vertexai.rag`` with deterministic, latency-injected responses."""
+
+    _PATCHED = ("retrieval_query", "list_files", "upload_file", "delete_file")
+
+    def __init__(
+        self,
+        latency: Latency | str = "0",
+        file_latency: Latency | str = "0",
+        contexts: int = 5,
+        files: int = 20,
+        stall: Latency | str = "0",
+        stall_rate: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int | None = None,
+    ) -> None:
+        self.latency = latency if isinstance(latency, Latency) else Latency(latency)
+        self.file_latency = (
+            file_latency if isinstance(file_latency, Latency) else Latency(file_latency)
+        )
+        self.contexts = contexts
+        self.files = files
+        self.stall = stall if isinstance(stall, Latency) else Latency(stall)
+        self.stall_rate = stall_rate
+        self.error_rate = error_rate
+        self._faults = random.Random(seed)
+        self.calls = {name: 0 for name in self._PATCHED}
+        self.faults = {"stalls": 0, "errors": 0}
+        self._saved: dict[str, object] = {}
+
+    def retrieval_query(self, rag_resources=None, rag_retrieval_config=None, text: str = "", **_):
+        self.calls["retrieval_query"] += 1
+        self.latency.sleep()
+        if self.stall_rate and self._faults.random() < self.stall_rate:
+            self.faults["stalls"] += 1
+            self.stall.sleep()
+        if self.error_rate and self._faults.random() < self.error_rate:
+            self.faults["errors"] += 1
+            raise RuntimeError("injected Vertex retrieval error")
+        corpus = rag_resources[0].rag_corpus if rag_resources else ""
+        rng = _rng(corpus, text)
+        contexts = [
+            SimpleNamespace(
+                text=" ".join(rng.choice(_WORDS) for _ in range(40)),
+                source_display_name=f"doc-{rng.randrange(self.files):03d}.pdf",
+                score=rng.uniform(0.05, 0.5),
+            )
+            for _ in range(self.contexts)
+        ]
+        return SimpleNamespace(contexts=SimpleNamespace(contexts=contexts))
+
+    def list_files(self, corpus_name: str = "", **_):
+        self.calls["list_files"] += 1
+        self.file_latency.sleep()
+        return SimpleNamespace(
+            rag_files=[
+                SimpleNamespace(name=f"{corpus_name}/ragFiles/{i}", display_name=f"doc-{i:03d}.pdf")
+                for i in range(self.files)
+            ]
+        )
+
+    def upload_file(self, corpus_name: str = "", path: str = "", display_name: str = "", **_):
+        self.calls["upload_file"] += 1
+        self.file_latency.sleep()
+        return SimpleNamespace(name=f"{corpus_name}/ragFiles/{display_name}")
+
+    def delete_file(self, name: str = "", **_):
+        self.calls["delete_file"] += 1
+        self.file_latency.sleep()
+
+    def install(self) -> "FakeVertexRag":
+        from vertexai import rag
+
+        for name in self._PATCHED:
+            self._saved[name] = getattr(rag, name)
+            setattr(rag, name, getattr(self, name))
+        return self
+
+    def uninstall(self) -> None:
+        from vertexai import rag
+
+        for name, original in self._saved.items():
+            setattr(rag, name, original)
+        self._saved.clear()
+
+
+@dataclass
+class FakeGeminiConfig:
+    decide: Latency = field(default_factory=Latency)  # turn that emits the tool call
+    first_token: Latency = field(default_factory=Latency)
+    token: Latency = field(default_factory=Latency)  # between streamed tokens
+    tokens: int = 64
+    script: list[str] | None = None  # fixed answer tokens (replay), else random words
+
+
+def _user_text(request: LlmRequest) -> str:
+    for content in reversed(request.contents or []):
+        if content.role == "user":
+            texts = [p.text for p in content.parts or [] if p.text]
+            if texts:
+                return " ".join(texts)
+    return ""
+
+
+def _has_tool_result(request: LlmRequest) -> bool:
+    last = request.contents[-1] if request.contents else None
+    return bool(last and any(p.function_response for p in last.parts or []))
+
+
+def _text(text: str) -> types.Content:
+    return types.Content(role="model", parts=[types.Part(text=text)])
+
+
+class FakeGemini(BaseLlm):
+    """ADK model that calls ``retrieve_documents`` once, then streams an answer."""
+
+    model: str = "fake-gemini"
+    config: ClassVar[FakeGeminiConfig] = FakeGeminiConfig()
+    calls: ClassVar[dict[str, int]] = {"tool_call": 0, "answer": 0}
+
+    @classmethod
+    def supported_models(cls) -> list[str]:
+        return [r"fake-.*"]
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        cfg = self.config
+        query = _user_text(llm_request)
+
+        if "retrieve_documents" in llm_request.tools_dict and not _has_tool_result(llm_request):
+            FakeGemini.calls["tool_call"] += 1
+            await cfg.decide.asleep()
+            call = types.FunctionCall(name="retrieve_documents", args={"query": query[:500]})
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(function_call=call)]))
+            return
+
+        FakeGemini.calls["answer"] += 1
+        if cfg.script:
+            tokens = cfg.script
+        else:
+            rng = _rng(query)
+            tokens = [rng.choice(_WORDS) + " " for _ in range(cfg.tokens)]
+        await cfg.first_token.asleep()
+        if not stream:
+            for _ in tokens[1:]:
+                await cfg.token.asleep()
+            yield LlmResponse(content=_text("".join(tokens)))
+            return
+
+        for i, token in enumerate(tokens):
+            if i:
+                await cfg.token.asleep()
+            yield LlmResponse(content=_text(token), partial=True)
+        yield LlmResponse(content=_text("".join(tokens)), partial=False)
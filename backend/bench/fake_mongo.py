@@ -0,0 +1,273 @@
+"""In-memory stand-in for ``pymongo.AsyncMongoClient``.
+
+Covers the subset of the async collection API that ``app.core.db`` and its
+callers use (``find_one``/``find`` with projection, sort and limit, inserts
+with unique indexes, ``$set``/``$addToSet`` updates of one or many documents,
+upserts, ``find_one_and_update``/``find_one_and_delete`` and deletes). Filters
+support equality, array membership, ``$in``, ``$lt``/``$lte``/``$gt``/``$gte``
+and ``$or``. Every call awaits a configurable ``Latency`` so a load test sees
+realistic database round trips.
+
+Plug it in with ``app.core.db.use_client(FakeMongoClient(...))``.
+"""
+
+from __future__ import annotations
+
+import copy
+import uuid
+from typing import Any
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from bench.latency import Latency
+
+_OPS = {
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$in": lambda a, b: (any(x in b for x in a) if isinstance(a, list) else a in b),
+    "$ne": lambda a, b: a != b,
+}
+
+
+def _match_value(actual: Any, expected: Any) -> bool:
+    if isinstance(expected, dict) and expected and all(k.startswith("$") for k in expected):
+        return all(_OPS[op](actual, arg) for op, arg in expected.items())
+    if isinstance(actual, list) and not isinstance(expected, list):
+        return expected in actual
+    return actual == expected
+
+
+def _matches(doc: dict, query: dict) -> bool:
+    for key, expected in query.items():
+        if key == "$or":
+            if not any(_matches(doc, q) for q in expected):
+                return False
+        elif not _match_value(doc.get(key), expected):
+            return False
+    return True
+
+
+def _project(doc: dict, projection: dict | None) -> dict:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        out = {k: doc[k] for k in include if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    for key, value in projection.items():
+        if not value:
+            doc.pop(key, None)
+    return doc
+
+
+def _sort_key(spec):
+    if isinstance(spec, str):
+        return [(spec, 1)]
+    return list(spec)
+
+
+def _sorted(docs: list[dict], spec) -> list[dict]:
+    for field, direction in reversed(_sort_key(spec)):
+        docs = sorted(
+            docs,
+            key=lambda d: (d.get(field) is None, d.get(field)),
+            reverse=direction < 0,
+        )
+    return docs
+
+
+class FakeCursor:
+    def __init__(self, docs: list[dict], projection: dict | None, latency: Latency) -> None:
+        self._docs = docs
+        self._latency = latency
+        self._projection = projection
+        self._limit = 0
+
+    def sort(self, key, direction: int = 1) -> "FakeCursor":
+        spec = key if isinstance(key, list) else [(key, direction)]
+        self._docs = _sorted(self._docs, spec)
+        return self
+
+    def limit(self, n: int) -> "FakeCursor":
+        self._limit = n
+        return self
+
+    def _items(self) -> list[dict]:
+        docs = self._docs[: self._limit] if self._limit else self._docs
+        return [_project(d, self._projection) for d in docs]
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        await self._latency.asleep()  # first batch
+        for doc in self._items():
+            yield doc
+
+    async def to_list(self, length: int | None = None) -> list[dict]:
+        await self._latency.asleep()
+        items = self._items()
+        return items[:length] if length else items
+
+
+class FakeCollection:
+    def __init__(self, latency: Latency) -> None:
+        self._latency = latency
+        self._docs: list[dict] = []
+        self._unique: list[tuple[str, ...]] = [("_id",)]
+
+    # --- helpers ------------------------------------------------------------
+
+    def _check_unique(self, doc: dict, ignore: dict | None = None) -> None:
+        for fields in self._unique:
+            key = tuple(doc.get(f) for f in fields)
+            for other in self._docs:
+                if other is not ignore and tuple(other.get(f) for f in fields) == key:
+                    raise DuplicateKeyError(f"E11000 duplicate key {dict(zip(fields, key))}")
+
+    def _find(self, query: dict | None) -> list[dict]:
+        return [d for d in self._docs if _matches(d, query or {})]
+
+    @staticmethod
+    def _apply(doc: dict, update: dict) -> None:
+        for key, value in update.get("$set", {}).items():
+            doc[key] = copy.deepcopy(value)
+        for key, value in update.get("$addToSet", {}).items():
+            items = doc.setdefault(key, [])
+            if value not in items:
+                items.append(value)
+
+    def _upsert_doc(self, query: dict, update: dict) -> dict:
+        doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+        doc.setdefault("_id", uuid.uuid4().hex)
+        self._apply(doc, update)
+        return doc
+
+    # --- API ----------------------------------------------------------------
+
+    async def create_index(self, keys, unique: bool = False, **_: Any) -> str:
+        fields = tuple(f for f, _ in _sort_key(keys))
+        if unique and fields not in self._unique:
+            self._unique.append(fields)
+        return "_".join(fields)
+
+    async def insert_one(self, doc: dict):
+        await self._latency.asleep()
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", uuid.uuid4().hex)
+        self._check_unique(doc)
+        self._docs.append(doc)
+
+    async def insert_many(self, docs: list[dict], ordered: bool = True):
+        await self._latency.asleep()
+        for doc in docs:
+            doc = copy.deepcopy(doc)
+            doc.setdefault("_id", uuid.uuid4().hex)
+            self._check_unique(doc)
+            self._docs.append(doc)
+
+    async def find_one(self, query: dict | None = None, projection: dict | None = None, sort=None):
+        await self._latency.asleep()
+        docs = self._find(query)
+        if sort:
+            docs = _sorted(docs, sort)
+        return _project(docs[0], projection) if docs else None
+
+    def find(self, query: dict | None = None, projection: dict | None = None) -> FakeCursor:
+        return FakeCursor(self._find(query), projection, self._latency)
+
+    async def count_documents(self, query: dict) -> int:
+        await self._latency.asleep()
+        return len(self._find(query))
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        await self._latency.asleep()
+        docs = self._find(query)
+        if docs:
+            updated = copy.deepcopy(docs[0])
+            self._apply(updated, update)
+            self._check_unique(updated, ignore=docs[0])
+            docs[0].clear()
+            docs[0].update(updated)
+        elif upsert:
+            doc = self._upsert_doc(query, update)
+            self._check_unique(doc)
+            self._docs.append(doc)
+
+    async def update_many(self, query: dict, update: dict):
+        await self._latency.asleep()
+        for doc in self._find(query):
+            self._apply(doc, update)
+
+    async def find_one_and_update(
+        self,
+        query: dict,
+        update: dict,
+        upsert: bool = False,
+        return_document=ReturnDocument.BEFORE,
+        projection: dict | None = None,
+    ):
+        await self._latency.asleep()
+        docs = self._find(query)
+        if docs:
+            before = copy.deepcopy(docs[0])
+            self._apply(docs[0], update)
+            return _project(docs[0] if return_document == ReturnDocument.AFTER else before, projection)
+        if not upsert:
+            return None
+        doc = self._upsert_doc(query, update)
+        self._check_unique(doc)
+        self._docs.append(doc)
+        return _project(doc, projection) if return_document == ReturnDocument.AFTER else None
+
+    async def find_one_and_delete(self, query: dict, sort=None, projection: dict | None = None):
+        await self._latency.asleep()
+        docs = self._find(query)
+        if sort:
+            docs = _sorted(docs, sort)
+        if not docs:
+            return None
+        self._docs.remove(docs[0])
+        return _project(docs[0], projection)
+
+    async def delete_one(self, query: dict):
+        await self._latency.asleep()
+        docs = self._find(query)
+        if docs:
+            self._docs.remove(docs[0])
+
+    async def delete_many(self, query: dict):
+        await self._latency.asleep()
+        for doc in self._find(query):
+            self._docs.remove(doc)
+
+
+class FakeDatabase:
+    def __init__(self, latency: Latency) -> None:
+        self._latency = latency
+        self._collections: dict[str, FakeCollection] = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(self._latency)
+        return self._collections[name]
+
+
+class FakeMongoClient:
+    def __init__(self, latency: Latency | str = "0") -> None:
+        self._latency = latency if isinstance(latency, Latency) else Latency(latency)
+        self._databases: dict[str, FakeDatabase] = {}
+
+    def __getitem__(self, name: str) -> FakeDatabase:
+        if name not in self._databases:
+            self._databases[name] = FakeDatabase(self._latency)
+        return self._databases[name]
+
+    async def close(self) -> None:
+        pass
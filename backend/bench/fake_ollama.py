@@ -0,0 +1,200 @@
+"""Deterministic stand-in for an Ollama server, for benchmarks and load tests.
+
+Implements the endpoints the offline stack uses (``/api/embed``,
+``/api/embeddings``, ``/api/chat`` streaming and non-streaming, ``/api/tags``)
+with configurable delays, so throughput and latency can be measured without
+a GPU, a model download, or run-to-run variance:
+
+  * embeddings are unit vectors seeded from a hash of the text, so equal text
+    always embeds identically;
+  * chat streams ``tokens`` words drawn from a seed derived from the prompt,
+    after ``first_token_delay`` and then ``token_delay`` between tokens.
+
+Run standalone (``python -m bench.fake_ollama --port 11434``) or start it in
+process with ``FakeOllama(...).start()``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_WORDS = (
+    "the document describes a process for retrieval augmented generation with "
+    "local models chunked passages vector search embeddings context answer "
+    "citation source policy handbook report summary section table figure"
+).split()
+
+
+@dataclass
+class FakeOllamaConfig:
+    dim: int = 256
+    # Seconds.
+    embed_delay: float = 0.0  # per request
+    embed_delay_per_text: float = 0.0
+    first_token_delay: float = 0.0
+    token_delay: float = 0.0
+    tokens: int = 64
+    models: tuple[str, ...] = ("llama3.2:latest", "nomic-embed-text:latest")
+
+
+def embedding(text: str, dim: int) -> list[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "big")
+    rng = random.Random(seed)
+    vec = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000000Z", time.gmtime())
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: FakeOllamaConfig  # set on the per-server subclass
+
+    def log_message(self, *args) -> None:  # keep benchmark output clean
+        pass
+
+    def _json(self, payload: dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self) -> None:
+        if self.path in ("/api/tags", "/api/tags/"):
+            self._json({"models": [{"name": m, "model": m} for m in self.config.models]})
+        elif self.path == "/":
+            self._json({"status": "Ollama is running"})
+        else:
+            self._json({"error": "not found"}, 404)
+
+    def do_POST(self) -> None:
+        cfg = self.config
+        body = self._body()
+        if self.path == "/api/embed":
+            texts = body.get("input") or []
+            texts = [texts] if isinstance(texts, str) else texts
+            time.sleep(cfg.embed_delay + cfg.embed_delay_per_text * len(texts))
+            self._json(
+                {"model": body.get("model"), "embeddings": [embedding(t, cfg.dim) for t in texts]}
+            )
+        elif self.path == "/api/embeddings":
+            time.sleep(cfg.embed_delay + cfg.embed_delay_per_text)
+            self._json({"embedding": embedding(body.get("prompt", ""), cfg.dim)})
+        elif self.path == "/api/chat":
+            self._chat(body)
+        else:
+            self._json({"error": "not found"}, 404)
+
+    def _chat(self, body: dict) -> None:
+        cfg = self.config
+        prompt = json.dumps(body.get("messages", []), sort_keys=True)
+        rng = random.Random(hashlib.sha256(prompt.encode()).hexdigest())
+        tokens = [rng.choice(_WORDS) + " " for _ in range(cfg.tokens)]
+        model = body.get("model")
+
+        def message(content: str, done: bool) -> dict:
+            out = {
+                "model": model,
+                "created_at": _now(),
+                "message": {"role": "assistant", "content": content},
+                "done": done,
+            }
+            if done:
+                out["done_reason"] = "stop"
+            return out
+
+        if not body.get("stream", True):
+            time.sleep(cfg.first_token_delay + cfg.token_delay * max(len(tokens) - 1, 0))
+            self._json(message("".join(tokens), True))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(cfg.first_token_delay)
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(cfg.token_delay)
+            self._chunk(json.dumps(message(token, False)).encode() + b"\n")
+        self._chunk(json.dumps(message("", True)).encode() + b"\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeOllama:
+    """Run the fake server on a background thread."""
+
+    def __init__(self, config: FakeOllamaConfig | None = None, host: str = "127.0.0.1", port: int = 0):
+        handler = type("Handler", (_Handler,), {"config": config or FakeOllamaConfig()})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllama":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--embed-delay-ms", type=float, default=0.0)
+    parser.add_argument("--embed-delay-per-text-ms", type=float, default=0.0)
+    parser.add_argument("--first-token-delay-ms", type=float, default=0.0)
+    parser.add_argument("--token-delay-ms", type=float, default=0.0)
+    parser.add_argument("--tokens", type=int, default=64)
+    args = parser.parse_args()
+
+    server = FakeOllama(
+        FakeOllamaConfig(
+            dim=args.dim,
+            embed_delay=args.embed_delay_ms / 1000,
+            embed_delay_per_text=args.embed_delay_per_text_ms / 1000,
+            first_token_delay=args.first_token_delay_ms / 1000,
+            token_delay=args.token_delay_ms / 1000,
+            tokens=args.tokens,
+        ),
+        host=args.host,
+        port=args.port,
+    )
+    print(f"Fake Ollama listening on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Configurable latency distributions for the benchmark stand-ins.
+
+Specs are short strings so they fit on a command line:
+
+  ``0`` / ``fixed:25``           always 25 ms
+  ``uniform:10,50``              uniform between 10 and 50 ms
+  ``lognormal:120,0.5``          lognormal with median 120 ms, sigma 0.5
+                                 (a long right tail, like real network calls)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import random
+import time
+
+
+class Latency:
+    def __init__(self, spec: str = "0", seed: int | None = None) -> None:
+        self.spec = spec
+        self._rng = random.Random(seed)
+        kind, _, params = spec.partition(":")
+        if not params:
+            kind, params = "fixed", kind
+        values = [float(v) for v in params.split(",") if v]
+        if kind == "fixed" and len(values) == 1:
+            self._sample = lambda: values[0]
+        elif kind == "uniform" and len(values) == 2:
+            self._sample = lambda: self._rng.uniform(values[0], values[1])
+        elif kind == "lognormal" and len(values) == 2:
+            mu, sigma = math.log(max(values[0], 1e-6)), values[1]
+            self._sample = lambda: self._rng.lognormvariate(mu, sigma)
+        else:
+            raise ValueError(f"Invalid latency spec: {spec!r}")
+
+    def seconds(self) -> float:
+        return max(self._sample(), 0.0) / 1000
+
+    def sleep(self) -> None:
+        delay = self.seconds()
+        if delay:
+            time.sleep(delay)
+
+    async def asleep(self) -> None:
+        delay = self.seconds()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def __repr__(self) -> str:
+        return f"Latency({self.spec!r})"
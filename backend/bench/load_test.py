@@ -0,0 +1,451 @@
+"""HTTP load test for the online API against local stand-ins.
+
+Boots ``app.main:app`` under uvicorn in this process. Vertex AI RAG calls go to
+``bench.fake_cloud.FakeVertexRag`` and the agent model is
+``bench.fake_cloud.FakeGemini``. MongoDB is ``bench.fake_mongo.FakeMongoClient``.
+Each stand-in has its own latency distribution (see ``bench.latency``). The
+real routes, auth, corpus resolution, ADK ``Runner``, session service, tool
+calls and SSE encoder all run unchanged. N concurrent virtual users then
+drive a weighted mix of ``/rag/stream``, ``/rag/query``, ``/rag/retrieve``,
+``/file/documents`` and ``/file/upload-file``.
+
+    cd backend
+    python -m bench.load_test --users 50 --duration 30 --output before.json
+    # ... change code ...
+    python -m bench.load_test --users 50 --duration 30 --compare before.json
+
+The report gives throughput, per-endpoint p50/p95/p99 latency and errors,
+and time to first token for streams. It also reports **event-loop lag** on
+the server: a monitor task measures how late ``asyncio.sleep`` wakes up. A
+blocking call on the loop (a sync SDK call, bcrypt, a big JSON dump) shows up
+there as a spike in p99/max lag, long before it shows up as user-visible
+latency. ``--max-loop-lag-ms`` turns that into a failing exit code for CI.
+
+Use ``--serve`` to run only the stubbed server (then point ``--url`` at it
+from another process or machine), so client and server don't share a GIL.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+from bench.fake_cloud import FakeGemini, FakeGeminiConfig, FakeVertexRag
+from bench.fake_mongo import FakeMongoClient
+from bench.latency import Latency
+from bench.offline_bench import _git_rev, _peak_rss_bytes, compare, percentiles
+
+ENDPOINTS = ("stream", "query", "retrieve", "documents", "upload")
+
+_QUESTIONS = (
+    "How many days of annual leave do I get?",
+    "Who approves travel expenses over the limit?",
+    "What is the policy for working remotely?",
+    "When is the quarterly report due?",
+    "How do I reset my laptop password?",
+    "What does the contract say about vendor payment terms?",
+)
+
+
+# --- Server side --------------------------------------------------------------
+
+
+class LoopLagMonitor:
+    """Sample how late the event loop wakes a sleeping task."""
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(loop.time() - start - self.interval, 0.0))
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+    def report(self, stall_ms: float) -> dict:
+        stalls = sum(1 for s in self.samples if s * 1000 >= stall_ms)
+        return {**percentiles(self.samples), f"stalls_over_{stall_ms:g}ms": stalls}
+
+
+def _configure_env(args: argparse.Namespace) -> None:
+    # Settings are read at import time, so pin everything that would otherwise
+    # reach real services (or a developer's .env) before importing the app.
+    os.environ["PROJECT_ID"] = ""
+    # Any URI enables the online routes; db.use_client swaps in the fake
+    # before anything connects.
+    os.environ["MONGO_URI"] = "mongodb://load-test.invalid:27017"
+    os.environ["SESSION_BACKEND"] = args.sessions
+    os.environ["CORPUS_POOL_TARGET"] = "0"
+    os.environ["JWT_SECRET"] = "load-test-secret"
+    os.environ["AGENT_FAST_MODE"] = "true" if args.fast else "false"
+    # Every generation goes to FakeGemini; keep model routing off.
+    os.environ["FAST_MODEL_ID"] = ""
+    os.environ.setdefault("TOOL_MAX_WORKERS", str(args.tool_workers))
+
+
+def build_app(args: argparse.Namespace):
+    """Import the app with every external dependency replaced by a stand-in."""
+    _configure_env(args)
+    import app.config as config
+    from app.agent import rag_agent, runner
+    from app.core import db
+    from app.main import app
+
+    vertex = FakeVertexRag(
+        Latency(args.retrieval_latency, seed=args.seed),
+        Latency(args.file_latency, seed=args.seed + 1),
+        contexts=args.contexts,
+    ).install()
+    FakeGemini.config = FakeGeminiConfig(
+        decide=Latency(args.llm_decide_latency, seed=args.seed + 2),
+        first_token=Latency(args.llm_first_token_latency, seed=args.seed + 3),
+        token=Latency(args.llm_token_latency, seed=args.seed + 4),
+        tokens=args.tokens,
+    )
+    rag_agent.MODEL_ID = FakeGemini()
+
+    mongo = FakeMongoClient(Latency(args.mongo_latency, seed=args.seed + 5))
+    db.use_client(mongo)
+    if args.sessions == "mongo":
+        from app.agent.sessions import build_session_service
+
+        # Built like production (TTL, flush policy), on the fake client.
+        config.use_session_service(build_session_service())
+
+    lag = LoopLagMonitor(args.lag_interval_ms / 1000)
+    app.router.on_startup.append(lag.start)
+    app.router.on_shutdown.append(lag.stop)
+
+    @app.post("/_bench/reset", include_in_schema=False)
+    def _reset() -> dict:
+        lag.samples.clear()
+        return {"ok": True}
+
+    @app.get("/_bench/stats", include_in_schema=False)
+    def _stats() -> dict:
+        return {
+            "loop_lag": lag.report(args.stall_ms),
+            "vertex_calls": dict(vertex.calls),
+            "llm_calls": dict(FakeGemini.calls),
+            "agent_pool": runner.runner_pool.stats(),
+            "peak_rss_bytes": _peak_rss_bytes(),
+        }
+
+    return app
+
+
+def _accounts(args: argparse.Namespace) -> list[tuple[dict, str]]:
+    """Deterministic (user document, bearer token) pairs for ``args.users``."""
+    from app.core.security import create_access_token
+
+    rng = random.Random(args.seed)
+    accounts = []
+    for i in range(args.users):
+        name = f"loaduser{i:05d}"
+        corpus = f"projects/bench/locations/local/ragCorpora/user-{i}"
+        # A share of tokens omit the corpus claim, so those requests take the
+        # Mongo lookup path (cold cache) the way pre-claim tokens would.
+        claims = {"sub": name}
+        if rng.random() >= args.claimless:
+            claims["corpus"] = corpus
+        user = {"username": name, "password": "-", "corpus": corpus, "corpus_status": "ready"}
+        accounts.append((user, create_access_token(claims)))
+    return accounts
+
+
+def _seed_users(accounts: list[tuple[dict, str]], shared: int) -> None:
+    """Insert the users (and shared corpora granted to all of them) into the fake Mongo."""
+    from app.core import db
+
+    users = [user for user, _ in accounts]
+    members = [u["username"] for u in users]
+
+    async def insert() -> None:
+        await db.ensure_indexes()
+        await db.users().insert_many(users)
+        if shared and members:
+            await db.shared_corpora().insert_many(
+                [
+                    {
+                        "name": f"shared-{i}",
+                        "owner": members[0],
+                        "corpus": f"projects/bench/locations/local/ragCorpora/shared-{i}",
+                        "members": members,
+                    }
+                    for i in range(shared)
+                ]
+            )
+
+    asyncio.run(insert())
+
+
+class _Server:
+    def __init__(self, app, host: str, port: int) -> None:
+        import uvicorn
+
+        class Server(uvicorn.Server):
+            def install_signal_handlers(self) -> None:  # not on the main thread
+                pass
+
+        self.url = f"http://{host}:{port}"
+        self._server = Server(
+            uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan="on")
+        )
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def start(self) -> "_Server":
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("uvicorn failed to start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# --- Client side --------------------------------------------------------------
+
+
+class Results:
+    def __init__(self) -> None:
+        self.latency: dict[str, list[float]] = {e: [] for e in ENDPOINTS}
+        self.ttft: list[float] = []
+        self.errors: dict[str, int] = {e: 0 for e in ENDPOINTS}
+        self.error_kinds: dict[str, int] = {}
+
+    def error(self, endpoint: str, kind: str) -> None:
+        self.errors[endpoint] += 1
+        self.error_kinds[kind] = self.error_kinds.get(kind, 0) + 1
+
+
+def _parse_mix(spec: str) -> dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint in --mix: {name!r} (choose from {ENDPOINTS})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def _stream(client, headers: dict, body: dict, start: float, results: Results) -> str | None:
+    session_id = None
+    first = True
+    async with client.stream("POST", "/rag/stream", json=body, headers=headers) as response:
+        response.raise_for_status()
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                if first and event is None:
+                    results.ttft.append(time.perf_counter() - start)
+                    first = False
+                if event == "done":
+                    session_id = json.loads(line[5:]).get("session_id")
+                event = None
+    return session_id
+
+
+async def _user(
+    index: int, client, token: str, mix: dict[str, float], deadline: float,
+    args: argparse.Namespace, results: Results,
+) -> None:
+    rng = random.Random(args.seed * 1000 + index)
+    headers = {"Authorization": f"Bearer {token}"}
+    names, weights = list(mix), list(mix.values())
+    session_id, turns = None, 0
+
+    while time.perf_counter() < deadline:
+        endpoint = rng.choices(names, weights)[0]
+        question = rng.choice(_QUESTIONS)
+        if turns >= args.turns:
+            session_id, turns = None, 0
+        body = {"text": question, "session_id": session_id}
+        start = time.perf_counter()
+        try:
+            if endpoint == "stream":
+                session_id = await _stream(client, headers, body, start, results) or session_id
+                turns += 1
+            elif endpoint == "query":
+                response = await client.post("/rag/query", json=body, headers=headers)
+                response.raise_for_status()
+                session_id = response.json().get("session_id") or session_id
+                turns += 1
+            elif endpoint == "retrieve":
+                response = await client.post("/rag/retrieve", json={"text": question}, headers=headers)
+                response.raise_for_status()
+            elif endpoint == "documents":
+                response = await client.get("/file/documents", headers=headers)
+                response.raise_for_status()
+            else:
+                files = {"file": (f"upload-{index}.txt", b"load test document\n" * 64, "text/plain")}
+                response = await client.post("/file/upload-file", files=files, headers=headers)
+                response.raise_for_status()
+        except Exception as exc:  # noqa: BLE001 - every failure is a data point
+            status = getattr(getattr(exc, "response", None), "status_code", None)
+            results.error(endpoint, f"HTTP {status}" if status else type(exc).__name__)
+        else:
+            results.latency[endpoint].append(time.perf_counter() - start)
+
+        if args.think_ms:
+            await asyncio.sleep(rng.expovariate(1000 / args.think_ms))
+
+
+async def drive(url: str, tokens: list[str], args: argparse.Namespace) -> dict:
+    import httpx
+
+    mix = _parse_mix(args.mix)
+    results = Results()
+    limits = httpx.Limits(max_connections=len(tokens) + 8, max_keepalive_connections=len(tokens) + 8)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        if args.warmup:
+            warm_deadline = time.perf_counter() + args.warmup
+            await asyncio.gather(
+                *(_user(i, client, t, mix, warm_deadline, args, Results()) for i, t in enumerate(tokens))
+            )
+        await client.post("/_bench/reset")
+
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(
+            *(_user(i, client, t, mix, deadline, args, results) for i, t in enumerate(tokens))
+        )
+        elapsed = time.perf_counter() - start
+        server = (await client.get("/_bench/stats")).json()
+
+    completed = sum(len(v) for v in results.latency.values())
+    errors = sum(results.errors.values())
+    return {
+        "benchmark": "load",
+        "git_rev": _git_rev(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "url")},
+        "seconds": round(elapsed, 3),
+        "requests": completed,
+        "errors": errors,
+        "throughput_rps": round(completed / elapsed, 2) if elapsed else None,
+        "endpoints": {
+            e: {**percentiles(results.latency[e]), "errors": results.errors[e]}
+            for e in mix
+        },
+        "stream_ttft": percentiles(results.ttft),
+        "error_kinds": results.error_kinds,
+        "server": server,
+    }
+
+
+# --- CLI ----------------------------------------------------------------------
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="HTTP load test against local stand-ins")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds first")
+    parser.add_argument("--mix", default="stream=5,query=2,retrieve=2,documents=1",
+                        help=f"weighted endpoints from {ENDPOINTS}")
+    parser.add_argument("--turns", type=int, default=4, help="turns per conversation")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="mean pause between requests")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--fast", action="store_true", help="enable AGENT_FAST_MODE")
+    parser.add_argument("--sessions", choices=("memory", "mongo"), default="memory",
+                        help="ADK session backend (mongo uses the fake Mongo)")
+    parser.add_argument("--shared", type=int, default=0, help="shared corpora per user")
+    parser.add_argument("--claimless", type=float, default=0.0,
+                        help="fraction of tokens without a corpus claim")
+    parser.add_argument("--contexts", type=int, default=5, help="passages per corpus query")
+    parser.add_argument("--tokens", type=int, default=64, help="tokens per answer")
+    parser.add_argument("--tool-workers", type=int, default=16)
+    # Latency distributions (see bench.latency): fixed:MS, uniform:A,B, lognormal:MEDIAN,SIGMA
+    parser.add_argument("--retrieval-latency", default="lognormal:150,0.4")
+    parser.add_argument("--file-latency", default="lognormal:80,0.3")
+    parser.add_argument("--mongo-latency", default="fixed:1")
+    parser.add_argument("--llm-decide-latency", default="lognormal:400,0.3")
+    parser.add_argument("--llm-first-token-latency", default="lognormal:500,0.3")
+    parser.add_argument("--llm-token-latency", default="fixed:10")
+    parser.add_argument("--lag-interval-ms", type=float, default=10.0)
+    parser.add_argument("--stall-ms", type=float, default=50.0, help="loop lag counted as a stall")
+    parser.add_argument("--max-loop-lag-ms", type=float,
+                        help="exit 1 if server p99 loop lag exceeds this")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--serve", action="store_true", help="only run the stubbed server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--url", help="drive an already running --serve instance")
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="baseline results JSON to diff against")
+    args = parser.parse_args()
+
+    # Tokens are minted with the same secret and seed as the server's users,
+    # so a separate --serve instance started with the same --users/--seed
+    # accepts them.
+    if args.url:
+        _configure_env(args)
+        tokens = [token for _, token in _accounts(args)]
+        results = asyncio.run(drive(args.url, tokens, args))
+    else:
+        app = build_app(args)
+        accounts = _accounts(args)
+        _seed_users(accounts, args.shared)
+        tokens = [token for _, token in accounts]
+        server = _Server(app, args.host, args.port or _free_port()).start()
+        if args.serve:
+            print(f"Stubbed RagAI API listening on {server.url} ({args.users} users seeded)")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                server.stop()
+            return
+        try:
+            results = asyncio.run(drive(server.url, tokens, args))
+        finally:
+            server.stop()
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        print("\n".join(compare(results, baseline)), file=sys.stderr)
+
+    p99_lag = results["server"]["loop_lag"].get("p99_ms")
+    if args.max_loop_lag_ms is not None and p99_lag is not None and p99_lag > args.max_loop_lag_ms:
+        print(f"Event-loop p99 lag {p99_lag} ms exceeds {args.max_loop_lag_ms} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Benchmark the offline pipeline (ingest, store query, RAG answers).
+
+Runs against a synthetic corpus and the deterministic fake Ollama in
+``bench.fake_ollama``, with a throwaway Chroma directory, so no model or real
+documents are needed and results are comparable between versions:
+
+    cd backend
+    python -m bench.offline_bench --docs 200 --queries 50 --output before.json
+    # ... change code ...
+    python -m bench.offline_bench --docs 200 --queries 50 --compare before.json
+
+Results are one JSON object: parameters, git revision, ingest docs/sec and
+chunks/sec, p50/p95/p99 latency for ``store.query``, ``run_query`` and
+``stream_query`` (time to first token and total), peak RSS and store size.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.fake_ollama import FakeOllama, FakeOllamaConfig
+
+_VOCAB = (
+    "policy leave holiday expense travel approval manager security password "
+    "device laptop onboarding payroll benefit insurance pension review goal "
+    "project deadline budget invoice vendor contract office remote meeting "
+    "report quarterly revenue customer support ticket escalation incident"
+).split()
+
+
+def percentiles(samples: list[float]) -> dict:
+    """Nearest-rank p50/p95/p99 (plus mean and max), in milliseconds."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(rank(50) * 1000, 3),
+        "p95_ms": round(rank(95) * 1000, 3),
+        "p99_ms": round(rank(99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def synthetic_corpus(n_docs: int, doc_chars: int, seed: int) -> list[tuple[str, bytes]]:
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n_docs):
+        words: list[str] = []
+        size = 0
+        while size < doc_chars:
+            sentence = " ".join(rng.choice(_VOCAB) for _ in range(rng.randint(6, 16))) + ". "
+            words.append(sentence.capitalize())
+            size += len(sentence)
+        docs.append((f"doc-{i:05d}.txt", "".join(words)[:doc_chars].encode()))
+    return docs
+
+
+def synthetic_queries(n: int, seed: int) -> list[str]:
+    rng = random.Random(seed + 1)
+    return [
+        "What does the handbook say about " + " ".join(rng.sample(_VOCAB, 3)) + "?"
+        for _ in range(n)
+    ]
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _git_rev() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args: argparse.Namespace) -> dict:
+    fake = FakeOllama(
+        FakeOllamaConfig(
+            dim=args.dim,
+            embed_delay=args.embed_delay_ms / 1000,
+            embed_delay_per_text=args.embed_delay_per_text_ms / 1000,
+            first_token_delay=args.first_token_delay_ms / 1000,
+            token_delay=args.token_delay_ms / 1000,
+            tokens=args.tokens,
+        )
+    ).start()
+    chroma_dir = tempfile.mkdtemp(prefix="ragai-bench-chroma-")
+
+    # The offline modules read settings and open their clients at import time,
+    # so point them at the fake server and scratch store before importing.
+    os.environ["OLLAMA_HOST"] = fake.url
+    os.environ["CHROMA_PATH"] = chroma_dir
+    os.environ["CHUNK_SIZE"] = str(args.chunk_size)
+    os.environ["CHUNK_OVERLAP"] = str(args.chunk_overlap)
+    os.environ["RETRIEVAL_TOP_K"] = str(args.top_k)
+    from app.offline import ingest, llm, rag, store
+
+    try:
+        docs = synthetic_corpus(args.docs, args.doc_chars, args.seed)
+        queries = synthetic_queries(args.queries, args.seed)
+
+        # --- Ingest ----------------------------------------------------------
+        chunks = 0
+        start = time.perf_counter()
+        for filename, data in docs:
+            chunks += ingest.ingest(filename, data)
+        ingest_s = time.perf_counter() - start
+
+        # --- Store query (embedding excluded) --------------------------------
+        embeddings = llm.embed(queries)
+        store_lat = []
+        for emb in embeddings:
+            t0 = time.perf_counter()
+            store.query(emb, args.top_k)
+            store_lat.append(time.perf_counter() - t0)
+
+        # --- run_query -------------------------------------------------------
+        run_lat = []
+        for q in queries:
+            t0 = time.perf_counter()
+            rag.run_query(None, q)
+            run_lat.append(time.perf_counter() - t0)
+
+        # --- stream_query ----------------------------------------------------
+        ttft, stream_lat = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            first = None
+            for item in rag.stream_query(None, q):
+                if first is None and isinstance(item, str):
+                    first = time.perf_counter() - t0
+            stream_lat.append(time.perf_counter() - t0)
+            if first is not None:
+                ttft.append(first)
+
+        return {
+            "benchmark": "offline",
+            "git_rev": _git_rev(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+            "ingest": {
+                "docs": len(docs),
+                "chunks": chunks,
+                "seconds": round(ingest_s, 3),
+                "docs_per_sec": round(len(docs) / ingest_s, 2) if ingest_s else None,
+                "chunks_per_sec": round(chunks / ingest_s, 2) if ingest_s else None,
+            },
+            "store_query": percentiles(store_lat),
+            "run_query": percentiles(run_lat),
+            "stream_query": {"ttft": percentiles(ttft), "total": percentiles(stream_lat)},
+            "peak_rss_bytes": _peak_rss_bytes(),
+            "store_bytes": _dir_size(chroma_dir),
+        }
+    finally:
+        fake.stop()
+        if not args.keep_store:
+            import shutil
+
+            shutil.rmtree(chroma_dir, ignore_errors=True)
+
+
+def _flatten(obj: dict, prefix: str = "") -> dict[str, float]:
+    out = {}
+    for key, value in obj.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[name] = value
+    return out
+
+
+def compare(current: dict, baseline: dict) -> list[str]:
+    """Human-readable deltas for every numeric result present in both runs."""
+    cur, base = _flatten(current), _flatten(baseline)
+    lines = []
+    for key in sorted(cur):
+        if key.startswith("params.") or key not in base or not base[key]:
+            continue
+        change = (cur[key] - base[key]) / base[key] * 100
+        lines.append(f"{key:40s} {base[key]:>14,.3f} -> {cur[key]:>14,.3f}  ({change:+.1f}%)")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline RAG pipeline benchmark")
+    parser.add_argument("--docs", type=int, default=100)
+    parser.add_argument("--doc-chars", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=150)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--dim", type=int, default=256, help="fake embedding dimension")
+    parser.add_argument("--embed-delay-ms", type=float, default=0.0)
+    parser.add_argument("--embed-delay-per-text-ms", type=float, default=0.0)
+    parser.add_argument("--first-token-delay-ms", type=float, default=0.0)
+    parser.add_argument("--token-delay-ms", type=float, default=0.0)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--keep-store", action="store_true", help="keep the Chroma directory")
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="baseline results JSON to diff against")
+    args = parser.parse_args()
+
+    results = run(args)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        print("\n".join(compare(results, baseline)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""Replay captured queries against the current build and diff per-stage latency.
+
+Input is the JSONL written by ``app.core.capture`` (``CAPTURE_ENABLED=true``);
+rotated files can be passed too. Each record is re-run through the real
+``agent.runner`` or ``offline.rag`` code path in process, with the model and
+retrieval replaced by stubs that return the *recorded* passages and answer:
+
+  * ``--timing recorded`` (default): the stubs also reproduce the recorded
+    upstream latencies, so a replayed query costs what it did in production
+    plus whatever this build adds;
+  * ``--timing zero``: the stubs answer instantly, isolating the build's own
+    overhead (session handling, prompt building, event plumbing, encoding).
+
+The replay is captured with the same capture layer, so stage names match, and
+each replayed trace is tagged with its record's ``replay_index``. The
+report lists recorded vs replayed p50/p95/p99 per backend, mode and stage.
+``--details`` adds per-record deltas. Save a report per commit with
+``--output`` and diff two with ``--compare`` to bisect a regression:
+
+    cd backend
+    python -m bench.replay data/capture/queries.jsonl --timing zero --output base.json
+    git checkout HEAD~5
+    python -m bench.replay data/capture/queries.jsonl --timing zero --compare base.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from bench.offline_bench import _git_rev, compare, percentiles
+
+
+def load_records(paths: list[str], backend: str | None, limit: int | None) -> list[dict]:
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if backend and record.get("backend") != backend:
+                    continue
+                records.append(record)
+    records.sort(key=lambda r: r.get("ts", ""))
+    return records[:limit] if limit else records
+
+
+def _tokens(record: dict) -> list[str]:
+    answer = record.get("answer") or ""
+    words = answer.split(" ")
+    tokens = [w + " " for w in words[:-1]] + [words[-1]] if answer else []
+    return [t for t in tokens if t] or ["(no answer recorded)"]
+
+
+def _plan(record: dict, zero: bool) -> dict:
+    """Split the recorded stage timings into per-stub delays (seconds)."""
+    if zero:
+        return {"embed": 0.0, "retrieve": 0.0, "decide": 0.0, "first_token": 0.0, "token": 0.0}
+    stages = record.get("stages", {})
+    ms = {k[:-3]: v / 1000 for k, v in stages.items() if k.endswith("_ms")}
+    total = ms.get("total", 0.0)
+    embed, retrieve = ms.get("embed", 0.0), ms.get("retrieve", 0.0)
+    tokens = len(_tokens(record))
+    ttft = ms.get("ttft")
+    before_token = (ttft if ttft is not None else total) - embed - retrieve
+    after_token = total - ttft if ttft is not None else 0.0
+    # The agent spends one model turn deciding to call retrieve_documents and
+    # one answering; the recording can't tell them apart, so split evenly.
+    two_turns = record["backend"] == "adk" and not record.get("fast") and record.get("tool_calls")
+    decide = max(before_token, 0.0) / 2 if two_turns else 0.0
+    return {
+        "embed": embed,
+        "retrieve": retrieve,
+        "decide": decide,
+        "first_token": max(before_token - decide, 0.0),
+        "token": max(after_token, 0.0) / max(tokens - 1, 1),
+    }
+
+
+def _contexts(record: dict) -> list[dict]:
+    return [
+        {"text": c.get("text", ""), "source": c.get("source") or "document", "score": c.get("score")}
+        for c in record.get("retrieval", [])
+    ]
+
+
+# --- Online (ADK) ---------------------------------------------------------------
+
+
+class _Online:
+    def __init__(self) -> None:
+        from bench.fake_cloud import FakeGemini, FakeVertexRag
+        from app.agent import rag_agent
+
+        self.record: dict = {}
+        self.delay = 0.0
+        self.vertex = FakeVertexRag()
+        self.vertex.retrieval_query = self._retrieval_query
+        self.vertex.install()
+        rag_agent.MODEL_ID = FakeGemini()
+
+    def _retrieval_query(self, **_):
+        time.sleep(self.delay)
+        return SimpleNamespace(
+            contexts=SimpleNamespace(
+                contexts=[
+                    SimpleNamespace(text=c["text"], source_display_name=c["source"], score=c["score"])
+                    for c in _contexts(self.record)
+                ]
+            )
+        )
+
+    async def _seed_history(self, user: str, session_id: str, turns: int) -> None:
+        from google.adk.events import Event
+        from google.genai import types
+
+        from app.config import APP_NAME, get_session_service
+
+        sessions = get_session_service()
+        session = await sessions.create_session(app_name=APP_NAME, user_id=user, session_id=session_id)
+        for i in range(turns):
+            role = "user" if i % 2 == 0 else "model"
+            await sessions.append_event(
+                session,
+                Event(
+                    invocation_id=f"replay-{i // 2}",
+                    author="user" if role == "user" else "rag_assistant",
+                    content=types.Content(role=role, parts=[types.Part(text=f"earlier turn {i}")]),
+                ),
+            )
+
+    async def run(self, index: int, record: dict, plan: dict) -> None:
+        from bench.fake_cloud import FakeGemini, FakeGeminiConfig
+        from bench.latency import Latency
+        from app.agent import runner
+
+        self.record, self.delay = record, plan["retrieve"]
+        FakeGemini.config = FakeGeminiConfig(
+            decide=Latency(f"fixed:{plan['decide'] * 1000}"),
+            first_token=Latency(f"fixed:{plan['first_token'] * 1000}"),
+            token=Latency(f"fixed:{plan['token'] * 1000}"),
+            script=_tokens(record),
+        )
+        user, session_id = f"replay-{index}", f"replay-{index}"
+        if record.get("history"):
+            await self._seed_history(user, session_id, record["history"])
+        corpora = tuple(f"replay-corpus-{i}" for i in range(record.get("corpora") or 1))
+        fast = bool(record.get("fast"))
+        if record.get("mode") == "stream":
+            async for _ in runner.stream_query(user, corpora, session_id, record["query"], fast=fast):
+                pass
+        else:
+            await runner.run_query(user, corpora, session_id, record["query"], fast=fast)
+
+
+# --- Offline (Ollama + Chroma) --------------------------------------------------
+
+
+class _Offline:
+    def __init__(self) -> None:
+        from app.offline import llm, store
+
+        self.record: dict = {}
+        self.plan: dict = {}
+        llm.embed = self._embed
+        llm.chat_stream = self._chat_stream
+        store.query = self._query
+
+    def _embed(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self.plan["embed"])
+        return [[0.0] * 8 for _ in texts]
+
+    def _query(self, embedding: list[float], k: int) -> list[dict]:
+        time.sleep(self.plan["retrieve"])
+        return [
+            {"text": c["text"], "source": c["source"], "distance": c["score"]}
+            for c in _contexts(self.record)
+        ]
+
+    def _chat_stream(self, messages: list[dict], model: str | None = None):
+        time.sleep(self.plan["first_token"])
+        for i, token in enumerate(_tokens(self.record)):
+            if i:
+                time.sleep(self.plan["token"])
+            yield token
+
+    async def run(self, index: int, record: dict, plan: dict) -> None:
+        from app.offline import rag
+
+        self.record, self.plan = record, plan
+        session_id = f"replay-{index}"
+        history = record.get("history", 0)
+        rag._sessions[session_id] = [
+            {"role": "user" if i % 2 == 0 else "assistant", "content": f"earlier turn {i}"}
+            for i in range(history)
+        ]
+        if record.get("mode") == "stream":
+            await asyncio.to_thread(lambda: list(rag.stream_query(session_id, record["query"])))
+        else:
+            await asyncio.to_thread(rag.run_query, session_id, record["query"])
+
+
+# --- Report ---------------------------------------------------------------------
+
+
+def _stage_table(pairs: list[tuple[dict, dict]]) -> dict:
+    table: dict[str, dict] = {}
+    for recorded, replayed in pairs:
+        group = f"{recorded['backend']}.{recorded.get('mode', 'query')}"
+        for source, record in (("recorded", recorded), ("replay", replayed)):
+            for key, value in record.get("stages", {}).items():
+                if key.endswith("_ms"):
+                    cell = table.setdefault(f"{group}.{key[:-3]}", {"recorded": [], "replay": []})
+                    cell[source].append(value / 1000)
+    return {
+        name: {"recorded": percentiles(cell["recorded"]), "replay": percentiles(cell["replay"])}
+        for name, cell in sorted(table.items())
+    }
+
+
+def _delta(recorded: dict, replayed: dict) -> dict:
+    a, b = recorded.get("stages", {}), replayed.get("stages", {})
+    return {k: round(b[k] - a[k], 2) for k in sorted(set(a) & set(b))}
+
+
+async def replay(records: list[dict], args: argparse.Namespace) -> list[dict]:
+    from app.core import capture
+
+    drivers: dict[str, object] = {}
+    index = None
+    start = capture.start
+
+    def tagged(*args, **fields):
+        # Label each trace with the record being replayed; main joins on it.
+        trace = start(*args, **fields)
+        if trace is not None:
+            trace.note(replay_index=index)
+        return trace
+
+    capture.start = tagged
+    for index, record in enumerate(records):
+        backend = record.get("backend")
+        if backend not in drivers:
+            drivers[backend] = _Online() if backend == "adk" else _Offline()
+        try:
+            await drivers[backend].run(index, record, _plan(record, args.timing == "zero"))
+        except Exception as exc:  # noqa: BLE001 - keep going; the capture has the error
+            print(f"record {index} failed: {type(exc).__name__}: {exc}", file=sys.stderr)
+    capture.close()
+    with open(os.environ["CAPTURE_PATH"], encoding="utf-8") as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay captured queries and diff stage latency")
+    parser.add_argument("paths", nargs="+", help="capture JSONL file(s)")
+    parser.add_argument("--backend", choices=("adk", "ollama"), help="only replay this backend")
+    parser.add_argument("--timing", choices=("recorded", "zero"), default="recorded")
+    parser.add_argument("--limit", type=int, help="replay at most N records")
+    parser.add_argument("--details", action="store_true", help="include per-record deltas")
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="earlier replay report to diff against")
+    args = parser.parse_args()
+
+    records = load_records(args.paths, args.backend, args.limit)
+    if not records:
+        raise SystemExit("No captured records to replay")
+
+    # Configure before the app is imported: capture every replayed query to a
+    # scratch file, and keep the online stack off real services.
+    out = tempfile.NamedTemporaryFile(prefix="ragai-replay-", suffix=".jsonl", delete=False)
+    out.close()
+    os.environ.update(
+        CAPTURE_ENABLED="true",
+        CAPTURE_PATH=out.name,
+        CAPTURE_SAMPLE_RATE="1",
+        CAPTURE_SLOW_MS="0",
+        CAPTURE_MAX_BYTES="0",
+        PROJECT_ID="",
+        MONGO_URI="",
+        SESSION_BACKEND="memory",
+        # The stubs stand in for every model; keep routing off.
+        FAST_MODEL_ID="",
+        OLLAMA_FAST_LLM_MODEL="",
+    )
+    try:
+        start = time.perf_counter()
+        replayed = asyncio.run(replay(records, args))
+        elapsed = time.perf_counter() - start
+    finally:
+        os.unlink(out.name)
+
+    by_index = {r["replay_index"]: r for r in replayed if r.get("replay_index") is not None}
+    pairs = [(record, by_index[i]) for i, record in enumerate(records) if i in by_index]
+    if len(pairs) != len(records):
+        print(f"warning: {len(records)} records, {len(pairs)} replayed", file=sys.stderr)
+    results = {
+        "benchmark": "replay",
+        "git_rev": _git_rev(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "params": {"timing": args.timing, "backend": args.backend, "records": len(records)},
+        "seconds": round(elapsed, 3),
+        "errors": sum(1 for _, r in pairs if r.get("error")),
+        "stages": _stage_table(pairs),
+    }
+    if args.details:
+        results["records"] = [
+            {"query": rec["query"][:80], "backend": rec["backend"], "mode": rec.get("mode"),
+             "delta_ms": _delta(rec, rep)}
+            for rec, rep in pairs
+        ]
+
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        print("\n".join(compare(results, baseline)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
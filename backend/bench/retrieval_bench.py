@@ -0,0 +1,173 @@
+"""Benchmark the hedged, deadline-bounded retrieval client against a fake Vertex.
+
+Runs ``app.services.retrieval.retrieve`` in process. ``bench.fake_cloud``
+stands in for ``vertexai.rag``, with a latency distribution plus injected
+stalls and errors, so tail behaviour is reproducible without GCP:
+
+    cd backend
+    python -m bench.retrieval_bench --queries 2000 --stall-rate 0.02 --stall fixed:3000
+    python -m bench.retrieval_bench --output before.json
+    python -m bench.retrieval_bench --compare before.json
+
+There are three phases, each on a fresh client:
+
+  * ``unhedged``: deadline only, the baseline tail;
+  * ``hedged``: the same traffic with hedging on. Compare p99 and the
+    hedge rate;
+  * ``outage``: after a warm-up pass, every Vertex call fails. Reports how
+    many queries were answered from cache (repeat queries), how many were
+    unavailable, and how fast the breaker made them. Once it opens, calls
+    should take microseconds rather than ``--deadline``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.latency import Latency
+from bench.offline_bench import _git_rev, compare, percentiles, synthetic_queries
+
+
+async def _drive(retrieval, corpora: tuple[str, ...], queries: list[str], concurrency: int) -> dict:
+    limit = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    async def one(text: str) -> None:
+        nonlocal errors
+        async with limit:
+            start = time.perf_counter()
+            try:
+                await retrieval.retrieve(corpora, text)
+            except Exception:  # noqa: BLE001 - counted, not fatal
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in queries))
+    elapsed = time.perf_counter() - start
+    return {
+        "queries": len(queries),
+        "errors": errors,
+        "qps": round(len(queries) / elapsed, 1) if elapsed else None,
+        "latency": percentiles(latencies),
+    }
+
+
+def _call_counts() -> dict[str, float]:
+    """Current ``ragai_retrieval_calls_total`` values by result."""
+    from app.services import retrieval
+
+    return {labels[0]: child.value for labels, child in retrieval.CALLS._children.items()}
+
+
+def _since(before: dict[str, float]) -> dict[str, int]:
+    return {
+        result: int(value - before.get(result, 0))
+        for result, value in _call_counts().items()
+        if value - before.get(result, 0)
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    from bench.fake_cloud import FakeVertexRag
+    from app.services import retrieval
+
+    vertex = FakeVertexRag(
+        Latency(args.latency, seed=args.seed),
+        contexts=5,
+        stall=Latency(args.stall, seed=args.seed + 1),
+        stall_rate=args.stall_rate,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    ).install()
+    executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="bench-retrieve")
+    corpora = tuple(f"projects/bench/locations/x/ragCorpora/{i}" for i in range(args.corpora))
+    queries = synthetic_queries(args.queries, args.seed)
+
+    def fresh(hedge: bool) -> retrieval.RetrievalClient:
+        return retrieval.RetrievalClient(
+            executor=executor,
+            deadline=args.deadline,
+            hedge=hedge,
+            hedge_max_ratio=args.hedge_ratio,
+        )
+
+    phases = {}
+    for name, hedge in (("unhedged", False), ("hedged", True)):
+        retrieval.client = fresh(hedge)
+        before = _call_counts()
+        phase = await _drive(retrieval, corpora, queries, args.concurrency)
+        phase["results"] = _since(before)
+        phase["client"] = retrieval.client.stats()
+        phases[name] = phase
+
+    # Outage: warm the last-good cache with half the queries, then fail everything.
+    retrieval.client = fresh(True)
+    warm = queries[: len(queries) // 2]
+    await _drive(retrieval, corpora, warm, args.concurrency)
+    vertex.error_rate = 1.0
+    before = _call_counts()
+    outage = await _drive(retrieval, corpora, queries, args.concurrency)
+    outage["results"] = _since(before)
+    outage["client"] = retrieval.client.stats()
+    phases["outage"] = outage
+
+    vertex.uninstall()
+    executor.shutdown(wait=False, cancel_futures=True)
+    return {
+        "benchmark": "retrieval",
+        "git_rev": _git_rev(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "params": {
+            k: getattr(args, k)
+            for k in ("queries", "concurrency", "corpora", "latency", "stall", "stall_rate",
+                      "error_rate", "deadline", "hedge_ratio", "workers", "seed")
+        },
+        "fake_vertex": {"calls": vertex.calls["retrieval_query"], **vertex.faults},
+        "phases": phases,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Hedged retrieval benchmark (fake Vertex)")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--corpora", type=int, default=1, help="corpora per query (fan-out)")
+    parser.add_argument("--latency", default="lognormal:120,0.3", help="normal Vertex latency")
+    parser.add_argument("--stall", default="fixed:2500", help="extra delay of a stalled call")
+    parser.add_argument("--stall-rate", type=float, default=0.03)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--deadline", type=float, default=8.0)
+    parser.add_argument("--hedge-ratio", type=float, default=0.1)
+    parser.add_argument("--workers", type=int, default=64, help="retrieval thread pool size")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="earlier results JSON to diff against")
+    args = parser.parse_args()
+
+    # Keep the app off real services before it is imported.
+    os.environ.update(PROJECT_ID="", MONGO_URI="")
+    results = asyncio.run(run(args))
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        print("\n".join(compare(results, baseline)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
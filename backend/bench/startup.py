@@ -0,0 +1,190 @@
+"""Startup profile: per-module import time and time to first ``/health``.
+
+    cd backend
+    python -m bench.startup                       # environment / .env as is
+    python -m bench.startup --offline             # offline-only deployment
+    python -m bench.startup --runs 5 --target-ms 1500 --output startup.json
+
+Import times come from ``python -X importtime -c "import app.main"`` in a
+fresh interpreter. They are grouped by top-level package, so a heavy SDK that
+sneaks back into the import path (``vertexai``, ``google.adk``, ``chromadb``
+…) is obvious. Time to first ``/health`` starts ``uvicorn app.main:app`` as a
+subprocess and polls until the probe answers 200. This is the number a
+scale-to-zero platform waits on. With online mode configured it then keeps
+polling until ``online.ready`` turns true (background warm-up finished).
+
+The run fails (exit 1) when the median time to first ``/health`` exceeds
+``--target-ms``. The default target is 1.5 s.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from bench.offline_bench import _git_rev
+
+DEFAULT_TARGET_MS = 1500.0
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _env(args: argparse.Namespace) -> dict:
+    env = dict(os.environ)
+    if args.offline:
+        env["PROJECT_ID"] = ""
+        env["MONGO_URI"] = ""
+    return env
+
+
+def import_profile(env: dict, top: int) -> dict:
+    """Run ``-X importtime`` on ``app.main`` and summarise it."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        env=env, capture_output=True, text=True,
+    )
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line.partition(":")[2].split("|")
+        try:
+            modules.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+        except (IndexError, ValueError):
+            continue  # the header line
+    if proc.returncode != 0:
+        raise SystemExit(f"import app.main failed:\n{proc.stderr[-2000:]}")
+
+    packages: dict[str, int] = {}
+    for name, self_us, _ in modules:
+        root = name.split(".")[0]
+        packages[root] = packages.get(root, 0) + self_us
+    total_us = sum(packages.values())
+    return {
+        "total_ms": round(total_us / 1000, 1),
+        "modules": len(modules),
+        "by_package_ms": {
+            k: round(v / 1000, 1)
+            for k, v in sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        },
+        "app_modules_cumulative_ms": {
+            name: round(cum / 1000, 1)
+            for name, _, cum in sorted(modules, key=lambda m: m[2], reverse=True)
+            if name.startswith("app")
+        },
+        "slowest_modules_self_ms": {
+            name: round(self_us / 1000, 1)
+            for name, self_us, _ in sorted(modules, key=lambda m: m[1], reverse=True)[:top]
+        },
+    }
+
+
+def _get_health(url: str) -> dict | None:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            if response.status == 200:
+                return json.load(response)
+    except (urllib.error.URLError, ConnectionError, TimeoutError, ValueError):
+        pass
+    return None
+
+
+def time_to_health(env: dict, timeout: float, wait_ready: bool) -> dict:
+    """Boot uvicorn once; return ms until /health answers (and until ready)."""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/health"
+    log = tempfile.TemporaryFile()
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=log,
+    )
+    result: dict = {}
+    try:
+        deadline = start + timeout
+        while time.perf_counter() < deadline:
+            if proc.poll() is not None:
+                log.seek(0)
+                raise SystemExit(f"uvicorn exited early:\n{log.read().decode()[-2000:]}")
+            health = _get_health(url)
+            if health is not None:
+                if "first_health_ms" not in result:
+                    result["first_health_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                online = health.get("online", {})
+                if not (wait_ready and online.get("configured")):
+                    break
+                if online.get("ready") or online.get("state") == "failed":
+                    result["ready_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                    result["state"] = online.get("state")
+                    break
+            time.sleep(0.005)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+    if "first_health_ms" not in result:
+        raise SystemExit(f"/health did not answer within {timeout}s")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import-time and time-to-first-/health profile")
+    parser.add_argument("--offline", action="store_true", help="blank cloud/Mongo config")
+    parser.add_argument("--runs", type=int, default=3, help="server boots to time")
+    parser.add_argument("--target-ms", type=float, default=DEFAULT_TARGET_MS,
+                        help="fail when median time to first /health exceeds this")
+    parser.add_argument("--no-ready", action="store_true",
+                        help="don't wait for online readiness after the first /health")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    args = parser.parse_args()
+
+    env = _env(args)
+    boots = [time_to_health(env, args.timeout, not args.no_ready) for _ in range(args.runs)]
+    first = [b["first_health_ms"] for b in boots]
+    ready = [b["ready_ms"] for b in boots if "ready_ms" in b]
+    median = statistics.median(first)
+    results = {
+        "benchmark": "startup",
+        "git_rev": _git_rev(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "offline": args.offline,
+        "imports": import_profile(env, args.top),
+        "first_health_ms": {"median": median, "min": min(first), "max": max(first), "runs": first},
+        "ready_ms": {"median": statistics.median(ready), "runs": ready} if ready else None,
+        "target_ms": args.target_ms,
+        "within_target": median <= args.target_ms,
+    }
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+    if median > args.target_ms:
+        print(f"Median time to first /health {median} ms exceeds target {args.target_ms} ms",
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,7 +26,7 @@ def deploy(corpus_name: str, staging_bucket: str):
     vertexai.init(project=PROJECT_ID, location=LOCATION, staging_bucket=staging_bucket)
 
     # Wrap the ADK agent so Agent Engine can serve it.
-    app = reasoning_engines.AdkApp(agent=build_agent(corpus_name), enable_tracing=True)
+    app = reasoning_engines.AdkApp(agent=build_agent((corpus_name,)), enable_tracing=True)
 
     remote_app = agent_engines.create(
         agent_engine=app,